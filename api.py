@@ -0,0 +1,140 @@
+# api.py
+
+import hashlib
+import random
+from datetime import datetime, timedelta
+
+from flask import session
+
+from learning import prepare_learning_queue
+from grading import EXACT, TYPO_MAX_EDITS, WRONG, normalize, rival_terms
+from history import API, append, entry
+from scheduling import TIME_DELTAS, get_next_status
+from wordlist_utils import get_due_chunk, get_due_word_ids, get_unlearned_word_ids, load_deck, update_words
+
+MAX_BATCH = 200  # Cards or results handled per request
+GRADE_RESULTS = ('correct', 'incorrect', 'learned')
+RESULT_GRADES = {'correct': EXACT, 'incorrect': WRONG, 'learned': EXACT}  # As recorded in the history
+
+
+def answer_hash(answer):
+    """
+    Hash of a normalized answer, so clients can grade without being shown it.
+    """
+    return hashlib.sha256(normalize(answer).encode('utf-8')).hexdigest()
+
+
+def card_from_deck(deck, word_id):
+    word = deck.word(word_id)
+    card = {
+        'id': word_id,
+        'english': word['english'],
+        'answer': word['swahili'],
+        'answer_hash': answer_hash(word['swahili']),
+        'status': word['status'],
+        'due': word['due']
+    }
+    if TYPO_MAX_EDITS:
+        # Other terms a typo must not be nearer to, as grade_answer checks
+        card['rivals'] = rival_terms(deck, word['swahili'])
+    return card
+
+
+def fetch_review_cards(username, limit):
+    """
+    Returns up to 'limit' due cards, most overdue first.
+    """
+    limit = max(1, min(limit, MAX_BATCH))
+    deck = load_deck(username)
+    return [card_from_deck(deck, word_id) for word_id in get_due_word_ids(username, limit)]
+
+
+def next_review_cards(username, count, restart=False):
+    """
+    Hands out the next 'count' due cards of the session, most overdue
+    first and shuffled within the batch. The session only keeps the
+    position reached, so cards handed out but not yet graded are not
+    handed out again. An empty list means no due cards are left.
+    """
+    count = max(1, min(count, MAX_BATCH))
+    after = None if restart else session.get('api_review_after')
+    word_ids, session['api_review_after'] = get_due_chunk(username, count, after)
+    random.shuffle(word_ids)
+    deck = load_deck(username)
+    return [card_from_deck(deck, word_id) for word_id in word_ids]
+
+
+def next_learning_cards(username):
+    """
+    Starts a learning round of up to five unlearned words and returns them
+    as cards, in the order prepare_learning_queue shuffled them into.
+    """
+    session['learning_ids'] = get_unlearned_word_ids(username, limit=5)
+    prepare_learning_queue()
+    deck = load_deck(username)
+    return [card_from_deck(deck, word_id) for word_id in session['learning_queue']]
+
+
+def _graded_at(value, now):
+    """
+    Parses a result's optional ISO 'graded_at' time, never later than now.
+    """
+    if not value:
+        return now
+    return min(datetime.fromisoformat(value), now)
+
+
+def apply_grades(username, results):
+    """
+    Applies a batch of graded results with the same rules as the review and
+    learning pages, and writes them in a single storage update.
+
+    Each result is {'id': word id, 'result': 'correct' | 'incorrect' | 'learned'},
+    optionally with 'graded_at' for answers given while offline.
+    Returns the new status and due date of each card, plus per-result errors.
+    """
+    deck = load_deck(username)
+    now = datetime.now()
+    pending = {}  # word id -> updated word, so repeated ids build on each other
+    errors = []
+    entries = []
+
+    for position, result in enumerate(results[:MAX_BATCH]):
+        word_id = result.get('id') if isinstance(result, dict) else None
+        outcome = result.get('result') if isinstance(result, dict) else None
+        if not isinstance(word_id, int) or not 0 <= word_id < len(deck):
+            errors.append({'index': position, 'error': 'Unknown card id.'})
+            continue
+        if outcome not in GRADE_RESULTS:
+            errors.append({'index': position, 'error': 'Result must be correct, incorrect or learned.'})
+            continue
+        try:
+            graded_at = _graded_at(result.get('graded_at'), now)
+        except (TypeError, ValueError):
+            errors.append({'index': position, 'error': 'graded_at must be an ISO date.'})
+            continue
+
+        word = pending.get(word_id) or deck.word(word_id)
+        previous_status = word['status']
+        if outcome == 'correct':
+            word['status'] = get_next_status(word['status'])
+            word['due'] = (graded_at + TIME_DELTAS[word['status']]).isoformat()
+        elif outcome == 'incorrect':
+            word['status'] = 'h4'
+            word['due'] = (graded_at + TIME_DELTAS['h4']).isoformat()
+        else:
+            word['status'] = 'h4'
+            word['due'] = (graded_at + timedelta(hours=4)).replace(second=0, microsecond=0).isoformat()
+        pending[word_id] = word
+        entries.append(entry(word, previous_status, RESULT_GRADES[outcome], API, int(graded_at.timestamp())))
+
+    update_words(username, list(pending.values()))
+    append(username, entries)
+    return {
+        'applied': len(results[:MAX_BATCH]) - len(errors),
+        'errors': errors,
+        'cards': [
+            {'id': word['id'], 'status': word['status'], 'due': word['due']}
+            for word in pending.values()
+        ]
+    }
@@ -0,0 +1,250 @@
+# benchmark.py
+
+"""
+Benchmarks the app against synthetic users with large decks.
+
+Usage:
+    python benchmark.py [--sizes 500,10000,100000] [--storage csv|sqlite]
+                        [--repeat 5] [--review-cards 50] [--output bench_results.jsonl]
+
+Each size gets its own synthetic user, built from the terms in
+decks/wordlist_500.csv. The run microbenchmarks the wordlist functions and
+drives every route through the Flask test client. One JSON object per
+measurement is appended to the output file, tagged with the current git
+commit, so runs from different commits can be compared.
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_WORDLIST = os.path.join(REPO_DIR, 'decks', 'wordlist_500.csv')
+
+# Share of learned words at each interval; the rest are not learned yet
+STATUS_WEIGHTS = {
+    'h4': 0.10, 'h24': 0.08, 'd6': 0.07, 'd12': 0.05,
+    'd24': 0.04, 'd48': 0.03, 'd96': 0.02, 'd180': 0.01,
+}
+
+
+def generate_deck(path, size, rng):
+    """
+    Writes a synthetic wordlist CSV of 'size' words. Learned words were last
+    reviewed at a random point within their interval or up to a week beyond
+    it, so a realistic share of them is overdue.
+    """
+    from scheduling import TIME_DELTAS
+
+    with open(SOURCE_WORDLIST, newline='', encoding='utf-8') as f:
+        terms = [(row['english'], row['swahili']) for row in csv.DictReader(f)]
+
+    statuses = list(STATUS_WEIGHTS) + ['']
+    weights = list(STATUS_WEIGHTS.values()) + [1 - sum(STATUS_WEIGHTS.values())]
+    now = datetime.now()
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['english', 'swahili', 'status', 'due'])
+        for i in range(size):
+            english, swahili = terms[i % len(terms)]
+            if i >= len(terms):
+                # Keep terms distinct once the source list has been used up
+                english, swahili = f'{english.strip()} {i}', f'{swahili.strip()} {i}'
+            status = rng.choices(statuses, weights)[0]
+            due = ''
+            if status:
+                reviewed = now - TIME_DELTAS[status] * rng.random() - timedelta(days=7) * rng.random() ** 3
+                due = (reviewed + TIME_DELTAS[status]).isoformat()
+            writer.writerow([english, swahili, status, due])
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return {
+        'n': len(ordered),
+        'mean_ms': statistics.mean(ordered) * 1000,
+        'p50_ms': ordered[len(ordered) // 2] * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        'min_ms': ordered[0] * 1000,
+    }
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class SessionDriver:
+    """
+    Walks the learn and review pages through the test client, answering from
+    the word ids held in the session, and times every request.
+    """
+
+    def __init__(self, app, username, rng, error_rate=0.1):
+        self.client = app.test_client()
+        self.username = username
+        self.rng = rng
+        self.error_rate = error_rate
+        self.timings = {}
+
+    def request(self, name, method, url, **kwargs):
+        start = time.perf_counter()
+        response = getattr(self.client, method)(url, **kwargs)
+        self.timings.setdefault(name, []).append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method.upper()} {url} returned {response.status_code}')
+        return response
+
+    def select_user(self):
+        self.request('change_user', 'post', '/simguistic/change_user', data={'username': self.username})
+
+    def correct_answer(self, id_key):
+        from wordlist_utils import get_word
+
+        with self.client.session_transaction() as sess:
+            word_id = sess.get(id_key)
+        return get_word(self.username, word_id)['swahili']
+
+    def run(self, route, max_steps):
+        self.select_user()
+        response = self.request(f'{route}_start', 'get', f'/simguistic/{route}')
+        id_key = 'current_learning_id' if route == 'learn' else 'current_review_id'
+        state_key = 'learning_state' if route == 'learn' else 'review_state'
+        for _ in range(max_steps):
+            with self.client.session_transaction() as sess:
+                state = sess.get(state_key)
+            if state is None:
+                break
+            if state == 'correction':
+                user_input = self.correct_answer(id_key)
+            elif state == 'testing':
+                user_input = 'wrong answer' if self.rng.random() < self.error_rate else self.correct_answer(id_key)
+            else:
+                user_input = 'continue'
+            response = self.request(f'{route}_{state}', 'post', f'/simguistic/{route}', data={'user_input': user_input})
+        return response
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    results = []
+    workdir = tempfile.mkdtemp(prefix='simguistic-bench-')
+    os.environ['SIMGUISTIC_STORAGE'] = args.storage
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(workdir)
+    os.makedirs('users')
+    try:
+        import main
+        import grading
+        import wordlist_utils
+        from wordlist_utils import load_wordlist, save_wordlist, get_word_counts, update_word
+
+        app = main.app
+        app.testing = True
+        common = {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'storage': args.storage,
+        }
+
+        def record(size, name, stats):
+            entry = dict(common, size=size, name=name, **stats)
+            results.append(entry)
+            print(f"{size:>7} {name:<28} p50 {entry['p50_ms']:9.3f} ms  p95 {entry['p95_ms']:9.3f} ms  (n={entry['n']})")
+
+        users = []
+        for size in args.sizes:
+            username = f'bench{size}'
+            generate_deck(os.path.join('users', f'{username}_wordlist.csv'), size, rng)
+            users.append((size, username))
+
+        for size, username in users:
+            def cold_load():
+                wordlist_utils._cache.invalidate(username)
+                load_wordlist(username)
+
+            def cold_counts():
+                wordlist_utils._cache.invalidate(username)
+                get_word_counts(username)
+
+            record(size, 'load_wordlist_cold', measure(cold_load, args.repeat))
+            record(size, 'load_wordlist_warm', measure(lambda: load_wordlist(username), args.repeat))
+            record(size, 'get_word_counts_cold', measure(cold_counts, args.repeat))
+            record(size, 'get_word_counts_warm', measure(lambda: get_word_counts(username), args.repeat))
+
+            wordlist = load_wordlist(username)
+            record(size, 'save_wordlist', measure(lambda: save_wordlist(username, wordlist), args.repeat))
+
+            def grade_one():
+                word = dict(rng.choice(wordlist))
+                word['status'] = 'h24'
+                word['due'] = (datetime.now() + timedelta(hours=24)).isoformat()
+                update_word(username, word)
+
+            record(size, 'update_word', measure(grade_one, max(args.repeat, 20)))
+
+            terms = [word['swahili'] for word in wordlist[:1000]]
+            record(size, 'normalize_x1000', measure(lambda: [grading.normalize(term) for term in terms], args.repeat))
+
+        driver_client = app.test_client()
+        record(sum(args.sizes), 'route_home', measure(lambda: driver_client.get('/simguistic'), args.repeat))
+
+        for size, username in users:
+            driver = SessionDriver(app, username, rng)
+            driver.select_user()
+            record(size, 'route_download_wordlist',
+                   measure(lambda: driver.client.post('/simguistic/download_wordlist'), args.repeat))
+            driver.run('learn', max_steps=500)
+            driver.run('review', max_steps=args.review_cards * 3)
+            for name, timings in sorted(driver.timings.items()):
+                record(size, f'route_{name}', summarize(timings))
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'a', encoding='utf-8') as f:
+        for entry in results:
+            f.write(json.dumps(entry) + '\n')
+    print(f'Wrote {len(results)} results to {args.output}')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='500,10000,100000',
+                        type=lambda value: [int(size) for size in value.split(',')],
+                        help='Comma-separated deck sizes, one synthetic user each')
+    parser.add_argument('--storage', default=os.environ.get('SIMGUISTIC_STORAGE', 'csv'),
+                        choices=['csv', 'sqlite'])
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per microbenchmark')
+    parser.add_argument('--review-cards', type=int, default=50, help='Cards to answer per review session')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=os.path.join(REPO_DIR, 'bench_results.jsonl'))
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    run(parse_args())
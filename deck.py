@@ -0,0 +1,345 @@
+# deck.py
+
+import json
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from scheduling import TIME_INTERVALS
+
+NEW = 0  # Status code of a word that has not been learned
+OTHER = 255  # Status code of a status outside TIME_INTERVALS, kept verbatim
+NO_DUE = -1  # Due time of a word without a due date
+STATUS_CODES = {status: code for code, status in enumerate(TIME_INTERVALS, start=1)}
+STATUS_CODES[''] = NEW
+
+SNAPSHOT_MAGIC = b'SGDECK01'
+# Magic, source file id (inode, size, mtime_ns), words, indexed words,
+# undated words, unlearned dated words, then byte lengths of terms and extra statuses
+SNAPSHOT_HEADER = struct.Struct('<8s3q6Q')
+
+
+def due_to_epoch(due_str):
+    """
+    Converts an ISO due date to whole epoch seconds, or NO_DUE if it is empty.
+    """
+    if not due_str:
+        return NO_DUE
+    return int(datetime.fromisoformat(due_str).timestamp())
+
+
+def epoch_to_due(due_ts):
+    """
+    Converts epoch seconds back to the ISO due date format used in wordlists.
+    """
+    if due_ts == NO_DUE:
+        return ''
+    return datetime.fromtimestamp(due_ts).isoformat()
+
+
+def _little_endian(column):
+    # Snapshots store integers little-endian whatever the machine
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column
+
+
+class Deck:
+    """
+    Column-oriented, in-memory form of a user's wordlist.
+
+    Terms are interned strings in two parallel lists, statuses are one byte
+    each (their position on the TIME_INTERVALS ladder) and due dates are
+    int64 epoch seconds. Learned words with a due date are also kept in a
+    pair of arrays sorted by due time, so counting and selecting due words
+    is a bisection and a slice rather than a pass over every word.
+    A word's id is its row number.
+    """
+
+    def __init__(self):
+        self.english = []
+        self.swahili = []
+        self.status = bytearray()
+        self.due = array('q')
+        self.other_status = {}  # word id -> status string outside the ladder
+        self._due_times = array('q')  # sorted due times of dated, learned words
+        self._due_ids = array('q')  # word ids in the same order
+        self._undated = set()  # learned words without a due date, always due
+        self._new_dated = 0  # unlearned words that nonetheless have a due date
+        self._shared_terms = False  # term lists belong to a base deck
+        self.term_index = None  # normalized swahili -> word ids, built by grading.term_index
+        self.term_tree = None  # BK-tree over those terms, built by grading.term_tree
+
+    @classmethod
+    def from_wordlist(cls, wordlist):
+        deck = cls()
+        for word in wordlist:
+            deck.append(word['english'], word['swahili'], word['status'], word['due'])
+        deck.build_due_index()
+        return deck
+
+    def fork(self):
+        """
+        Returns a copy that shares this deck's term lists, which must then be
+        treated as read-only. Only the status and due columns are copied.
+        """
+        deck = Deck()
+        deck.english = self.english
+        deck.swahili = self.swahili
+        deck.status = bytearray(self.status)
+        deck.due = array('q', self.due)
+        deck.other_status = dict(self.other_status)
+        deck._due_times = array('q', self._due_times)
+        deck._due_ids = array('q', self._due_ids)
+        deck._undated = set(self._undated)
+        deck._new_dated = self._new_dated
+        deck._shared_terms = True
+        deck.term_index = self.term_index
+        deck.term_tree = self.term_tree
+        return deck
+
+    def __len__(self):
+        return len(self.status)
+
+    def clear_progress(self):
+        """
+        Marks every word as not learned and without a due date.
+        """
+        self.status = bytearray(len(self.status))
+        self.due = array('q', [NO_DUE]) * len(self.status)
+        self.other_status = {}
+        self.build_due_index()
+
+    def append(self, english, swahili, status, due_str):
+        """
+        Adds a word at the end of the deck; call build_due_index afterwards.
+        """
+        word_id = len(self.status)
+        self.term_index = self.term_tree = None
+        self.english.append(sys.intern(english))
+        self.swahili.append(sys.intern(swahili))
+        self.status.append(self._encode_status(word_id, status))
+        self.due.append(due_to_epoch(due_str))
+        return word_id
+
+    def assign(self, word_id, status, due_str):
+        """
+        Sets a word's status and due date; call build_due_index afterwards.
+        """
+        self.status[word_id] = self._encode_status(word_id, status)
+        self.due[word_id] = due_to_epoch(due_str)
+
+    def _encode_status(self, word_id, status):
+        code = STATUS_CODES.get(status)
+        if code is None:
+            self.other_status[word_id] = status
+            return OTHER
+        self.other_status.pop(word_id, None)
+        return code
+
+    def status_of(self, word_id):
+        code = self.status[word_id]
+        if code == OTHER:
+            return self.other_status[word_id]
+        return TIME_INTERVALS[code - 1] if code else ''
+
+    def build_due_index(self):
+        status, due = self.status, self.due
+        dated = sorted(
+            (due[word_id], word_id) for word_id in range(len(status))
+            if status[word_id] and due[word_id] != NO_DUE
+        )
+        self._due_times = array('q', [due_ts for due_ts, _ in dated])
+        self._due_ids = array('q', [word_id for _, word_id in dated])
+        self._undated = {
+            word_id for word_id in range(len(status))
+            if status[word_id] and due[word_id] == NO_DUE
+        }
+        self._new_dated = sum(
+            1 for word_id in range(len(status))
+            if not status[word_id] and due[word_id] != NO_DUE
+        )
+
+    def _index_position(self, due_ts, word_id):
+        # Dated words are ordered by (due time, id); ids are sorted within a due time
+        lo = bisect_left(self._due_times, due_ts)
+        hi = bisect_right(self._due_times, due_ts, lo)
+        return bisect_left(self._due_ids, word_id, lo, hi)
+
+    def _unindex(self, word_id):
+        due_ts = self.due[word_id]
+        if not self.status[word_id]:
+            if due_ts != NO_DUE:
+                self._new_dated -= 1
+        elif due_ts == NO_DUE:
+            self._undated.discard(word_id)
+        else:
+            position = self._index_position(due_ts, word_id)
+            del self._due_times[position]
+            del self._due_ids[position]
+
+    def _index(self, word_id):
+        due_ts = self.due[word_id]
+        if not self.status[word_id]:
+            if due_ts != NO_DUE:
+                self._new_dated += 1
+        elif due_ts == NO_DUE:
+            self._undated.add(word_id)
+        else:
+            position = self._index_position(due_ts, word_id)
+            self._due_times.insert(position, due_ts)
+            self._due_ids.insert(position, word_id)
+
+    def update(self, word_id, status, due_str):
+        """
+        Sets a word's status and due date, keeping the due index current.
+        """
+        self._unindex(word_id)
+        self.status[word_id] = self._encode_status(word_id, status)
+        self.due[word_id] = due_to_epoch(due_str)
+        self._index(word_id)
+
+    def word(self, word_id):
+        """
+        Returns a word as a dict in the wordlist format.
+        """
+        return {
+            'id': word_id,
+            'english': self.english[word_id],
+            'swahili': self.swahili[word_id],
+            'status': self.status_of(word_id),
+            'due': epoch_to_due(self.due[word_id])
+        }
+
+    def write_snapshot(self, f, source_id):
+        """
+        Writes the deck, due index included, to a binary file that
+        read_snapshot can load without parsing any dates. 'source_id' is
+        the snapshot_id of the file the deck was read from.
+        Raises ValueError if a term contains a NUL character.
+        """
+        if any('\0' in term for term in self.english) or any('\0' in term for term in self.swahili):
+            raise ValueError('Terms containing NUL cannot be snapshotted')
+        terms = '\0'.join(self.english + self.swahili).encode('utf-8')
+        other = json.dumps(self.other_status).encode('utf-8')
+        f.write(SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC, *source_id, len(self), len(self._due_ids), len(self._undated),
+            self._new_dated, len(terms), len(other)
+        ))
+        f.write(self.status)
+        for column in (self.due, self._due_times, self._due_ids, array('q', sorted(self._undated))):
+            f.write(_little_endian(column).tobytes())
+        f.write(terms)
+        f.write(other)
+
+    @classmethod
+    def read_snapshot(cls, data, source_id):
+        """
+        Loads a deck from a buffer written by write_snapshot, such as a
+        memory-mapped file. Returns None if the buffer is not a snapshot
+        of the given source file.
+        """
+        fields = SNAPSHOT_HEADER.unpack_from(data)
+        if fields[0] != SNAPSHOT_MAGIC or list(fields[1:4]) != list(source_id):
+            return None
+        count, indexed, undated, new_dated, terms_size, other_size = fields[4:]
+        deck = cls()
+        offset = SNAPSHOT_HEADER.size
+        deck.status = bytearray(data[offset:offset + count])
+        offset += count
+        columns = []
+        for length in (count, indexed, indexed, undated):
+            column = array('q')
+            column.frombytes(data[offset:offset + 8 * length])
+            columns.append(_little_endian(column))
+            offset += 8 * length
+        deck.due, deck._due_times, deck._due_ids, undated_ids = columns
+        deck._undated = set(undated_ids)
+        deck._new_dated = new_dated
+        terms = bytes(data[offset:offset + terms_size]).decode('utf-8').split('\0') if count else []
+        offset += terms_size
+        deck.english = list(map(sys.intern, terms[:count]))
+        deck.swahili = list(map(sys.intern, terms[count:]))
+        deck.other_status = {
+            int(word_id): status
+            for word_id, status in json.loads(bytes(data[offset:offset + other_size])).items()
+        }
+        if len(deck.swahili) != count or len(deck.due) != count:
+            return None
+        return deck
+
+    def to_wordlist(self):
+        return [self.word(word_id) for word_id in range(len(self))]
+
+    def learned_count(self):
+        return len(self.status) - self.status.count(NEW)
+
+    def not_learned_count(self):
+        return self.status.count(NEW) - self._new_dated
+
+    def count_due(self, now_ts):
+        """
+        Number of learned words whose due date has passed.
+        """
+        return bisect_right(self._due_times, now_ts)
+
+    def due_ids(self, now_ts, limit=None, after=None):
+        """
+        Ids of due words in (due time, id) order, so undated ones come first,
+        then the most overdue. 'after' is a (due time, id) key to resume
+        after, as returned by due_key.
+        """
+        after_due, after_id = after if after is not None else (NO_DUE, -1)
+        ids = []
+        if after_due == NO_DUE:
+            ids = sorted(word_id for word_id in self._undated if word_id > after_id)
+            start = 0
+        else:
+            lo = bisect_left(self._due_times, after_due)
+            hi = bisect_right(self._due_times, after_due, lo)
+            start = bisect_right(self._due_ids, after_id, lo, hi)
+        end = self.count_due(now_ts)
+        if limit is not None:
+            ids = ids[:limit]
+            end = min(end, start + limit - len(ids))
+        ids.extend(self._due_ids[start:end])
+        return ids
+
+    def due_key(self, word_id):
+        """
+        Position of a word in due order, for resuming due_ids after it.
+        """
+        return [self.due[word_id] if self.status[word_id] else NO_DUE, word_id]
+
+    def unlearned_ids(self, limit=None):
+        """
+        Ids of words that have not been learned yet, in deck order.
+        """
+        ids = []
+        position = self.status.find(NEW)
+        while position != -1 and (limit is None or len(ids) < limit):
+            ids.append(position)
+            position = self.status.find(NEW, position + 1)
+        return ids
+
+    def nbytes(self):
+        """
+        Approximate memory held by the deck, counting each distinct string once
+        and terms shared with a base deck not at all.
+        """
+        terms = 0
+        if not self._shared_terms:
+            strings = {id(term): term for term in self.english}
+            strings.update((id(term), term) for term in self.swahili)
+            terms = (
+                sum(sys.getsizeof(term) for term in strings.values())
+                + sys.getsizeof(self.english) + sys.getsizeof(self.swahili)
+            )
+        return (
+            terms
+            + len(self.status) + self.due.itemsize * len(self.due)
+            + 2 * self._due_times.itemsize * len(self._due_times)
+        )
@@ -0,0 +1,96 @@
+# downloads.py
+
+import io
+import zlib
+import zipfile
+
+from flask import Response, request
+
+from wordlist_utils import get_wordlist_version, iter_wordlist_csv
+
+ENCODINGS = {'gzip': 31, 'deflate': 15}  # zlib wbits for each Content-Encoding
+
+
+def choose_encoding():
+    """
+    Returns the compression the client accepts best, or None for identity.
+    """
+    encoding = request.accept_encodings.best_match(list(ENCODINGS))
+    return encoding if encoding and request.accept_encodings[encoding] > 0 else None
+
+
+def compress(chunks, encoding):
+    """
+    Compresses a stream of text chunks as they are produced.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, ENCODINGS[encoding])
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def wordlist_response(username):
+    """
+    Streams a user's wordlist as a CSV download, compressed if the client
+    accepts it, and answers conditional requests for an unchanged wordlist
+    with 304 Not Modified before anything is generated.
+    """
+    etag, last_modified = get_wordlist_version(username)
+    encoding = choose_encoding()
+    if encoding:
+        body = compress(iter_wordlist_csv(username), encoding)
+    else:
+        body = (chunk.encode('utf-8') for chunk in iter_wordlist_csv(username))
+
+    response = Response(body, mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="{username}_wordlist.csv"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    # Compressed and plain bodies differ, so each gets its own tag
+    response.set_etag(f'{etag}-{encoding}' if encoding else etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True  # Cache, but revalidate before each use
+    return response.make_conditional(request)
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only, unseekable file that collects what is written until drained.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_users_zip(usernames):
+    """
+    Yields a zip archive of the given users' wordlists as it is built.
+    The archive is written to an unseekable sink, so zipfile puts each
+    entry's sizes after its data and nothing is buffered beyond a chunk.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for username in usernames:
+            with archive.open(f'{username}_wordlist.csv', 'w', force_zip64=True) as entry:
+                for chunk in iter_wordlist_csv(username):
+                    entry.write(chunk.encode('utf-8'))
+                    data = sink.drain()
+                    if data:
+                        yield data
+    yield sink.drain()
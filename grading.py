@@ -0,0 +1,195 @@
+# grading.py
+
+"""
+Answer checking shared by the learning and review pages, the JSON API and
+the importer.
+
+Answers are compared after normalize(), which drops ASCII punctuation and
+accents, folds case and collapses whitespace. With
+SIMGUISTIC_TYPO_TOLERANCE set to a number of edits, answers that are a
+few typos away from the expected one are also accepted. Every four
+characters of the expected answer allow one edit, up to that number.
+Given the deck, an answer that is another word's term, or nearer to one
+than to the expected term, is not taken for a typo.
+"""
+
+import os
+import string
+import unicodedata
+
+TYPO_MAX_EDITS = int(os.environ.get('SIMGUISTIC_TYPO_TOLERANCE', 0))
+CHARS_PER_EDIT = 4
+
+EXACT = 'exact'
+CLOSE = 'close'  # Accepted, but only within the typo tolerance
+WRONG = 'wrong'
+
+_REMOVE_PUNCTUATION = str.maketrans('', '', string.punctuation)
+
+
+def normalize(text):
+    """
+    Canonical form of an answer: compatibility decomposed, case folded by
+    upper- then lowercasing, no marks (accents) or ASCII punctuation, and
+    single spaces between words. Every step has an exact counterpart in
+    JavaScript, which normalize() in cards.js uses, so answers normalize
+    the same in the browser.
+    """
+    if text.isascii():
+        text = text.lower()
+    else:
+        text = unicodedata.normalize('NFKD', text).upper().lower()
+        text = ''.join(ch for ch in text if unicodedata.category(ch)[0] != 'M')
+    return ' '.join(text.translate(_REMOVE_PUNCTUATION).split())
+
+
+def allowed_edits(expected):
+    """
+    Typos tolerated in an answer to a normalized expected term.
+    """
+    return min(TYPO_MAX_EDITS, len(expected) // CHARS_PER_EDIT)
+
+
+def edit_distance(a, b, limit):
+    """
+    Levenshtein distance between two strings, or limit + 1 as soon as it
+    is certain to exceed 'limit'.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+def grade_answer(user_input, expected, deck=None):
+    """
+    Grades an answer as EXACT, CLOSE (a tolerated typo) or WRONG. With the
+    deck, a typo that lands on or nearer to another word's term is WRONG.
+    """
+    answer = normalize(user_input)
+    target = normalize(expected)
+    if answer == target:
+        return EXACT
+    edits = allowed_edits(target)
+    if not edits:
+        return WRONG
+    distance = edit_distance(answer, target, edits)
+    if distance > edits:
+        return WRONG
+    if deck is not None:
+        for term in _rivals(deck, target, edits):
+            if edit_distance(answer, term, distance - 1) < distance:
+                return WRONG
+    return CLOSE
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree of terms, for finding every term within a few edits
+    of a query without comparing it to each term.
+    """
+
+    def __init__(self, terms=()):
+        self.root = None  # [term, {distance: child node}]
+        for term in terms:
+            self.add(term)
+
+    def add(self, term):
+        if self.root is None:
+            self.root = [term, {}]
+            return
+        node = self.root
+        while True:
+            distance = edit_distance(term, node[0], len(term) + len(node[0]))
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [term, {}]
+                return
+            node = child
+
+    def search(self, query, limit):
+        """
+        Returns (distance, term) pairs for the terms within 'limit' edits, nearest first.
+        """
+        matches = []
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            term, children = nodes.pop()
+            distance = edit_distance(query, term, len(query) + len(term))
+            if distance <= limit:
+                matches.append((distance, term))
+            for child_distance, child in children.items():
+                if distance - limit <= child_distance <= distance + limit:
+                    nodes.append(child)
+        return sorted(matches)
+
+
+def term_index(deck):
+    """
+    Maps each normalized swahili term of the deck to the ids of its words.
+    Built on first use and kept on the deck, whose terms never change.
+    """
+    if deck.term_index is None:
+        index = {}
+        for word_id, swahili in enumerate(deck.swahili):
+            index.setdefault(normalize(swahili), []).append(word_id)
+        deck.term_index = index
+    return deck.term_index
+
+
+def term_tree(deck):
+    if deck.term_tree is None:
+        deck.term_tree = BKTree(term_index(deck))
+    return deck.term_tree
+
+
+def _rivals(deck, target, edits):
+    # A tolerated answer nearer to another term than to the target is fewer
+    # than 2 * edits from the target, by the triangle inequality
+    return [term for _, term in term_tree(deck).search(target, 2 * edits) if term != target]
+
+
+def rival_terms(deck, expected):
+    """
+    Normalized terms of other words that a tolerated typo of 'expected'
+    could be mistaken for, so clients can grade as grade_answer does.
+    """
+    target = normalize(expected)
+    edits = allowed_edits(target)
+    return _rivals(deck, target, edits) if edits else []
+
+
+def find_other_card(deck, user_input, word_id):
+    """
+    Returns the id of another word whose swahili term the answer matches,
+    exactly or within the typo tolerance, or None.
+    """
+    answer = normalize(user_input)
+    if not answer:
+        return None
+    for other_id in term_index(deck).get(answer, ()):
+        if other_id != word_id:
+            return other_id
+    edits = allowed_edits(answer)
+    if edits:
+        index = term_index(deck)
+        for _, term in term_tree(deck).search(answer, edits):
+            for other_id in index[term]:
+                if other_id != word_id:
+                    return other_id
+    return None
@@ -0,0 +1,204 @@
+# history.py
+
+"""
+Per-user log of grading outcomes, kept as fixed-width binary records in
+'users/{username}_history.bin', and the analytics computed from it.
+
+Each record is 32 bytes: the time of the grade, the word id, the word's
+next due time (epoch seconds, NO_DUE if none), its status code before and
+after (deck.STATUS_CODES), the outcome and where it was graded. Records
+are only ever appended, one write per batch. A reader maps the file and
+unpacks it in bulk, ignoring a partly written record at the end, so the
+analytics never parse text or load a deck.
+
+A history starts with a baseline: a record of the due date of every
+learned word in the deck at the time, so the forecast also covers words
+graded before the history existed.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from deck import NO_DUE, OTHER, STATUS_CODES, due_to_epoch
+from grading import CLOSE, EXACT, WRONG
+from scheduling import TIME_INTERVALS
+from user_management import USERS_DIR
+from wordlist_utils import load_deck
+
+RECORD = struct.Struct('<qqqBBBB4x')  # graded_at, word id, due, old status, new status, outcome, source
+
+OUTCOME_CODES = {EXACT: 1, CLOSE: 2, WRONG: 3}
+MOVED = 0  # Outcome of a record that only moved a due date
+WRONG_CODE = OUTCOME_CODES[WRONG]
+
+REVIEW = 1  # Sources: the review page,
+LEARN = 2  # the learning page,
+API = 3  # grades posted to the JSON API
+SCHEDULER = 4  # due dates moved by scheduler.py
+BASELINE = 5  # and the due dates a history started from
+
+FORECAST_DAYS = 30
+
+
+def history_path(username):
+    return os.path.join(USERS_DIR, f'{username}_history.bin')
+
+
+def entry(word, previous_status, outcome, source, graded_at=None):
+    """
+    Packs one record for a word dict as it is after grading. 'outcome' is
+    a grade from the grading module, or None for a moved due date.
+    """
+    if graded_at is None:
+        graded_at = int(time.time())
+    return RECORD.pack(
+        graded_at,
+        word['id'],
+        due_to_epoch(word['due']),
+        STATUS_CODES.get(previous_status, OTHER),
+        STATUS_CODES.get(word['status'], OTHER),
+        OUTCOME_CODES[outcome] if outcome is not None else MOVED,
+        source
+    )
+
+
+def baseline(username):
+    """
+    Starts the user's history, if it does not exist yet, with a record of
+    each learned word's current due date. The history appears complete, so
+    records appended by others always follow the baseline.
+    """
+    filepath = history_path(username)
+    if os.path.exists(filepath):
+        return
+    deck = load_deck(username)
+    now_ts = int(time.time())
+    data = b''.join(
+        RECORD.pack(now_ts, word_id, due_ts, code, code, MOVED, BASELINE)
+        for word_id, (code, due_ts) in enumerate(zip(deck.status, deck.due))
+        if code
+    )
+    tmp_path = f'{filepath}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.link(tmp_path, filepath)
+    except FileExistsError:
+        pass  # Another worker started it first
+    finally:
+        os.remove(tmp_path)
+
+
+def append(username, entries):
+    """
+    Appends packed records to the user's history in a single write.
+    """
+    data = b''.join(entries)
+    if not data:
+        return
+    baseline(username)
+    fd = os.open(history_path(username), os.O_WRONLY | os.O_APPEND)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def record(username, word, previous_status, outcome, source):
+    """
+    Records a single grading outcome.
+    """
+    append(username, [entry(word, previous_status, outcome, source)])
+
+
+def scan(username):
+    """
+    Yields the user's records as tuples in the order they were written.
+    """
+    try:
+        f = open(history_path(username), 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        size -= size % RECORD.size  # A record still being written
+        if not size:
+            return
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as data:
+            records = RECORD.iter_unpack(data)
+            try:
+                yield from records
+            finally:
+                del records  # Releases the mapping before it is closed
+
+
+def retention(username):
+    """
+    Share of review answers that were right, for each step of TIME_INTERVALS.
+    """
+    attempts = Counter()
+    correct = Counter()
+    for _, _, _, old_status, _, outcome, source in scan(username):
+        if source == LEARN or outcome == MOVED:
+            continue
+        attempts[old_status] += 1
+        if outcome != WRONG_CODE:
+            correct[old_status] += 1
+    return [
+        {
+            'status': status,
+            'attempts': attempts[code],
+            'correct': correct[code],
+            'retention': correct[code] / attempts[code] if attempts[code] else None
+        }
+        for code, status in enumerate(TIME_INTERVALS, start=1)
+    ]
+
+
+def hardest_words(username, limit=20, min_attempts=3):
+    """
+    Word ids answered wrongly most often, as a share of their attempts.
+    """
+    attempts = Counter()
+    wrong = Counter()
+    for _, word_id, _, _, _, outcome, _ in scan(username):
+        if outcome == MOVED:
+            continue
+        attempts[word_id] += 1
+        if outcome == WRONG_CODE:
+            wrong[word_id] += 1
+    ranked = sorted(
+        (word_id for word_id in wrong if attempts[word_id] >= min_attempts),
+        key=lambda word_id: (-wrong[word_id] / attempts[word_id], -wrong[word_id], word_id)
+    )
+    return [
+        {'id': word_id, 'attempts': attempts[word_id], 'wrong': wrong[word_id]}
+        for word_id in ranked[:limit]
+    ]
+
+
+def due_forecast(username, days=FORECAST_DAYS, now_ts=None):
+    """
+    Reviews falling due on each of the next 'days' days, from each word's
+    latest record. Overdue words count towards today.
+    """
+    if now_ts is None:
+        now_ts = int(time.time())
+    baseline(username)
+    latest = {}  # word id -> due time
+    for _, word_id, due_ts, _, new_status, _, _ in scan(username):
+        latest[word_id] = due_ts if new_status else NO_DUE
+    today = date.fromtimestamp(now_ts)
+    counts = Counter()
+    for due_ts in latest.values():
+        if due_ts != NO_DUE:
+            counts[max((date.fromtimestamp(due_ts) - today).days, 0)] += 1
+    return [
+        {'date': (today + timedelta(days=offset)).isoformat(), 'due': counts[offset]}
+        for offset in range(days)
+    ]
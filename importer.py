@@ -0,0 +1,156 @@
+# importer.py
+
+"""
+Imports a large CSV or TSV vocabulary into a user's wordlist.
+
+Usage:
+    python importer.py USERNAME FILE [--batch-size 1000]
+
+FILE may be '-' to read from stdin. The delimiter is sniffed from the
+first lines. A header row naming 'english' and 'swahili' (and optionally
+'status' and 'due') is used when present. Otherwise the columns are taken
+in that order. Run it from the app directory, where 'users/' lives.
+
+Rows are read one at a time and written in batches. A row is skipped as a
+duplicate when its english and swahili terms match a word already in the
+deck, or earlier in the file, after the normalize() used for grading.
+Only a 64-bit hash is kept per known word, never the rows themselves.
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import itertools
+import sys
+from datetime import datetime
+
+from deck import STATUS_CODES
+from grading import normalize
+from wordlist_utils import append_words, load_deck, wordlist_exists
+
+BATCH_SIZE = 1000  # Rows written per storage append
+SNIFF_BYTES = 64 * 1024
+MAX_TERM_LENGTH = 200
+MAX_ERRORS = 20  # Invalid rows reported by line number; the rest are only counted
+
+
+def term_key(english, swahili):
+    """
+    Hash identifying a word by its normalized terms.
+    """
+    key = f'{normalize(english)}\x1f{normalize(swahili)}'.encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+def read_rows(textfile):
+    """
+    Yields (line number, row) from a CSV or TSV file, sniffing the delimiter
+    from the first lines without reading the whole file.
+    """
+    sample = textfile.read(SNIFF_BYTES)
+    sample += textfile.readline()  # Finish the last sampled line
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',\t;')
+    except csv.Error:
+        dialect = csv.excel_tab if sample.count('\t') > sample.count(',') else csv.excel
+    lines = itertools.chain(io.StringIO(sample, newline=''), textfile)
+    reader = csv.reader(lines, dialect)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def parse_word(row, columns):
+    """
+    Builds a word dict from a row, or raises ValueError saying what is wrong.
+    """
+    values = {name: row[index].strip() if index < len(row) else '' for name, index in columns.items()}
+    word = {
+        'english': values['english'],
+        'swahili': values['swahili'],
+        'status': values.get('status', ''),
+        'due': values.get('due', '')
+    }
+    if not word['english'] or not word['swahili']:
+        raise ValueError('english and swahili are required')
+    if len(word['english']) > MAX_TERM_LENGTH or len(word['swahili']) > MAX_TERM_LENGTH:
+        raise ValueError(f'terms are limited to {MAX_TERM_LENGTH} characters')
+    if word['status'] not in STATUS_CODES:
+        raise ValueError(f"unknown status '{word['status']}'")
+    if word['due']:
+        datetime.fromisoformat(word['due'])  # Raises ValueError for a malformed date
+    return word
+
+
+def import_wordlist(username, textfile, batch_size=BATCH_SIZE):
+    """
+    Streams words from an open text file into the user's wordlist.
+    Returns counts of rows read, added, skipped as duplicates and invalid,
+    with messages for the first few invalid rows.
+    """
+    seen = set()
+    if wordlist_exists(username):
+        deck = load_deck(username)
+        seen.update(term_key(english, swahili) for english, swahili in zip(deck.english, deck.swahili))
+
+    result = {'rows': 0, 'added': 0, 'duplicates': 0, 'invalid': 0, 'errors': []}
+    columns = None
+    batch = []
+    for line_num, row in read_rows(textfile):
+        if not any(cell.strip() for cell in row):
+            continue
+        if columns is None:
+            header = [cell.strip().lower() for cell in row]
+            if 'english' in header and 'swahili' in header:
+                columns = {name: header.index(name) for name in ('english', 'swahili', 'status', 'due')
+                           if name in header}
+                continue
+            columns = {'english': 0, 'swahili': 1, 'status': 2, 'due': 3}
+
+        result['rows'] += 1
+        try:
+            word = parse_word(row, columns)
+        except ValueError as e:
+            result['invalid'] += 1
+            if len(result['errors']) < MAX_ERRORS:
+                result['errors'].append(f'Line {line_num}: {e}')
+            continue
+        key = term_key(word['english'], word['swahili'])
+        if key in seen:
+            result['duplicates'] += 1
+            continue
+        seen.add(key)
+        batch.append(word)
+        if len(batch) >= batch_size:
+            append_words(username, batch)
+            result['added'] += len(batch)
+            batch = []
+
+    append_words(username, batch)
+    result['added'] += len(batch)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('username')
+    parser.add_argument('file', help="CSV or TSV file, or '-' for stdin")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.file == '-':
+        textfile = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+    else:
+        textfile = open(args.file, 'r', encoding='utf-8-sig', newline='')
+    with textfile:
+        result = import_wordlist(args.username, textfile, args.batch_size)
+
+    print(f"Read {result['rows']} rows: {result['added']} added, "
+          f"{result['duplicates']} duplicates, {result['invalid']} invalid")
+    for error in result['errors']:
+        print(error, file=sys.stderr)
+    return 1 if result['invalid'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
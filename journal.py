@@ -0,0 +1,188 @@
+# journal.py
+
+import atexit
+import json
+import os
+import threading
+import time
+
+FSYNC_BATCH = 8  # Appends between fsyncs
+FSYNC_INTERVAL = 1.0  # Seconds before pending appends are fsynced anyway
+COMPACT_BYTES = 64 * 1024  # Journal size at which it is folded into the snapshot
+
+
+def snapshot_id(path):
+    """
+    Identifies a snapshot file by inode, size and mtime, or None if it is missing.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+
+class Journal:
+    """
+    Append-only log of grading events for one user, replayed over a snapshot.
+
+    The first line of the journal names the snapshot it was started against.
+    Replacing the snapshot (compaction or a full save) changes its identity,
+    so a journal left behind by a crash between the two steps is recognised
+    as already folded in and ignored. Every other entry is an absolute
+    status/due assignment, so replaying a journal always yields the same deck.
+    """
+
+    def __init__(self, path, snapshot_path):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self._file = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._file is None:
+            if not self._is_current():
+                # Missing, or left over from a snapshot that has since been replaced
+                self._write_header()
+            self._file = open(self.path, 'a', encoding='utf-8')
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    # Terminate a line torn by a crash so the next entry stays parseable
+                    self._file.write('\n')
+        return self._file
+
+    def _read_header(self, f):
+        try:
+            return json.loads(f.readline()).get('snapshot')
+        except (ValueError, AttributeError):
+            return None
+
+    def _is_current(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                snapshot = self._read_header(f)
+        except FileNotFoundError:
+            return False
+        return snapshot is not None and snapshot == snapshot_id(self.snapshot_path)
+
+    def _write_header(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'snapshot': snapshot_id(self.snapshot_path)}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, words, sync=False):
+        """
+        Appends one entry per word and flushes it to the OS; fsyncs in batches,
+        or straight away when sync is True. Callers hold the user's lock.
+        """
+        now = time.time()
+        lines = ''.join(
+            json.dumps({
+                'id': word['id'],
+                'swahili': word['swahili'],
+                'status': word['status'],
+                'due': word['due'],
+                'ts': now
+            }, ensure_ascii=False) + '\n'
+            for word in words
+        )
+        with self._lock:
+            if self._file is not None and not self._is_current():
+                # Another process replaced the snapshot without starting a new journal
+                self._file.close()
+                self._file = None
+            f = self._open()
+            f.write(lines)
+            f.flush()
+            self._pending += len(words)
+            if sync or self._pending >= FSYNC_BATCH or time.monotonic() - self._last_sync >= FSYNC_INTERVAL:
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        """
+        Forces pending entries to disk.
+        """
+        with self._lock:
+            if self._file is not None and self._pending:
+                self._sync()
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def entries(self):
+        """
+        Yields the journal entries that still apply to the current snapshot.
+        """
+        try:
+            f = open(self.path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return
+        with f:
+            snapshot = self._read_header(f)
+            if snapshot is None or snapshot != snapshot_id(self.snapshot_path):
+                return
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # Torn final write
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def replay(self, wordlist):
+        """
+        Applies the journal to a wordlist loaded from the snapshot, in order.
+        """
+        for entry in self.entries():
+            word_id = entry['id']
+            if 0 <= word_id < len(wordlist) and wordlist[word_id]['swahili'] == entry['swahili']:
+                wordlist[word_id]['status'] = entry['status']
+                wordlist[word_id]['due'] = entry['due']
+        return wordlist
+
+    def reset(self):
+        """
+        Starts an empty journal against the current snapshot.
+        """
+        with self._lock:
+            self._write_header()
+            self._pending = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                if self._pending:
+                    self._sync()
+                self._file.close()
+                self._file = None
+
+
+_journals = {}
+
+
+def get_journal(path, snapshot_path):
+    """
+    Returns the process-wide journal for a path, so fsync batching spans requests.
+    """
+    journal = _journals.get(path)
+    if journal is None:
+        journal = _journals.setdefault(path, Journal(path, snapshot_path))
+    return journal
+
+
+@atexit.register
+def _close_journals():
+    for journal in list(_journals.values()):
+        journal.close()
@@ -3,52 +3,33 @@
 from flask import session
 from datetime import datetime, timedelta
 import random
-import string  # Import string module
 
 from user_management import get_current_user
-from wordlist_utils import load_wordlist, save_wordlist
-
-def normalize(text):
-    # Helper function to remove punctuation and convert to lowercase
-    translator = str.maketrans('', '', string.punctuation)
-    return text.translate(translator).strip().lower()
+from grading import CLOSE, WRONG, grade_answer
+from history import LEARN, record
+from wordlist_utils import get_unlearned_word_ids, get_word, load_deck, update_word, get_other_card_hint
 
 def start_learning_session():
     username = get_current_user()
     if not username:
         return {'error': 'No user selected.'}
 
-    wordlist = load_wordlist(username)
-    unknown_words = [word for word in wordlist if not word['status']]
-    if not unknown_words:
+    unknown_ids = get_unlearned_word_ids(username, limit=5)
+    if not unknown_ids:
         return {'message': 'All words have been learned!'}
 
-    session['learning_words'] = unknown_words[:5]
-    # Use normalized keys for learning_progress
-    session['learning_progress'] = {normalize(word['swahili']): 0 for word in session['learning_words']}
+    # Only word ids live in the session; the words themselves stay in storage
+    session['learning_ids'] = unknown_ids
+    # Progress is keyed by word id (as a string, since session keys are JSON)
+    session['learning_progress'] = {str(word_id): 0 for word_id in session['learning_ids']}
     session['learning_queue'] = []
-    session['presented_words'] = []
+    session['learning_cursor'] = 0
+    session['presented_ids'] = []
     session['learning_state'] = 'start'
 
     prepare_learning_queue()
 
-    next_word = session['learning_queue'].pop(0)
-    session['current_learning_word'] = next_word
-
-    if next_word['swahili'] not in session['presented_words']:
-        session['learning_state'] = 'presentation'
-        session['presented_words'].append(next_word['swahili'])
-        return {
-            'english_word': next_word['english'],
-            'swahili_word': next_word['swahili'],
-            'state': 'presentation'
-        }
-    else:
-        session['learning_state'] = 'testing'
-        return {
-            'english_word': next_word['english'],
-            'state': 'testing'
-        }
+    return present_next_word(username)
 
 def process_learning_input(user_input):
     """
@@ -64,7 +45,8 @@ def process_learning_input(user_input):
     if not username:
         return {'error': 'No user selected.'}
 
-    current_word = session.get('current_learning_word')
+    current_id = session.get('current_learning_id')
+    current_word = get_word(username, current_id) if current_id is not None else None
     if not current_word:
         return {'error': 'No word is currently being learned.'}
 
@@ -72,15 +54,14 @@ def process_learning_input(user_input):
     progress = session.get('learning_progress', {})
 
     # Ensure progress dictionary is initialized for the current word
-    key = normalize(current_word['swahili'])
-    progress.setdefault(key, 0)
+    progress.setdefault(str(current_id), 0)
 
     if learning_state == 'presentation':
         return handle_presentation_state(current_word)
     elif learning_state == 'testing':
         return handle_testing_state(user_input, current_word, progress, username)
     elif learning_state == 'correction':
-        return handle_correction_state(user_input, current_word)
+        return handle_correction_state(user_input, current_word, username)
     elif learning_state == 'correct':
         return handle_correct_state(username)
     else:
@@ -100,49 +81,52 @@ def handle_presentation_state(current_word):
 
 def handle_testing_state(user_input, current_word, progress, username):
     """Handles the 'testing' state."""
-    correct_translation = normalize(current_word['swahili'])
-    user_input_clean = normalize(user_input)
+    key = str(current_word['id'])
+    previous_status = current_word['status']
+    grade = grade_answer(user_input, current_word['swahili'], load_deck(username))
 
-    if user_input_clean == correct_translation:
-        progress[correct_translation] += 1
+    if grade != WRONG:
+        progress[key] += 1
+        spelling = f" (Spelling: {current_word['swahili']})" if grade == CLOSE else ''
 
-        if progress[correct_translation] >= 3:
+        if progress[key] >= 3:
             mark_word_as_learned(username, current_word, progress)
+            record(username, current_word, previous_status, grade, LEARN)
             session['learning_state'] = 'correct'
             return {
                 'english_word': current_word['english'],
                 'user_input': user_input,
-                'message': 'New word learned!',
+                'message': 'New word learned!' + spelling,
                 'state': 'correct',
                 'delay': True
             }
         else:
+            record(username, current_word, previous_status, grade, LEARN)
             session['learning_state'] = 'correct'
             return {
                 'english_word': current_word['english'],
                 'user_input': user_input,
-                'message': 'Correct!',
+                'message': 'Correct!' + spelling,
                 'state': 'correct',
                 'delay': True
             }
     else:
-        progress[correct_translation] = 0
+        progress[key] = 0
+        record(username, current_word, previous_status, grade, LEARN)
         session['learning_state'] = 'correction'
         return {
             'english_word': current_word['english'],
             'user_input': user_input,
             'correct_translation': current_word['swahili'],
             'error': 'Incorrect.',
+            'hint': get_other_card_hint(username, user_input, current_word['id']),
             'state': 'correction'
         }
 
 
-def handle_correction_state(user_input, current_word):
+def handle_correction_state(user_input, current_word, username):
     """Handles the 'correction' state."""
-    correct_translation = normalize(current_word['swahili'])
-    user_input_clean = normalize(user_input)
-
-    if user_input_clean == correct_translation:
+    if grade_answer(user_input, current_word['swahili'], load_deck(username)) != WRONG:
         session['learning_state'] = 'testing'
         return {
             'english_word': current_word['english'],
@@ -160,28 +144,10 @@ def handle_correction_state(user_input, current_word):
 
 def handle_correct_state(username):
     """Handles the 'correct' state."""
-    if session['learning_words']:
-        if not session.get('learning_queue'):
+    if session['learning_ids']:
+        if session.get('learning_cursor', 0) >= len(session.get('learning_queue', [])):
             prepare_learning_queue()
-
-        if session['learning_queue']:
-            next_word = session['learning_queue'].pop(0)
-            session['current_learning_word'] = next_word
-
-            if next_word['swahili'] not in session.get('presented_words', []):
-                session['presented_words'] = session.get('presented_words', []) + [next_word['swahili']]
-                session['learning_state'] = 'presentation'
-                return {
-                    'english_word': next_word['english'],
-                    'swahili_word': next_word['swahili'],
-                    'state': 'presentation'
-                }
-            else:
-                session['learning_state'] = 'testing'
-                return {
-                    'english_word': next_word['english'],
-                    'state': 'testing'
-                }
+        return present_next_word(username)
     else:
         session.clear()
         return {
@@ -190,27 +156,47 @@ def handle_correct_state(username):
         }
 
 
+def present_next_word(username):
+    """Advances the learning queue cursor and presents or tests the next word."""
+    queue = session['learning_queue']
+    cursor = session.get('learning_cursor', 0)
+    next_word = get_word(username, queue[cursor])
+    session['learning_cursor'] = cursor + 1
+    session['current_learning_id'] = next_word['id']
+
+    if next_word['id'] not in session.get('presented_ids', []):
+        session['presented_ids'] = session.get('presented_ids', []) + [next_word['id']]
+        session['learning_state'] = 'presentation'
+        return {
+            'english_word': next_word['english'],
+            'swahili_word': next_word['swahili'],
+            'state': 'presentation'
+        }
+    else:
+        session['learning_state'] = 'testing'
+        return {
+            'english_word': next_word['english'],
+            'state': 'testing'
+        }
+
+
 def mark_word_as_learned(username, current_word, progress):
     """Marks a word as learned and updates the word list."""
-    key = normalize(current_word['swahili'])
-    wordlist = load_wordlist(username)
     now = datetime.now()
     due_time = (now + timedelta(hours=4)).replace(second=0, microsecond=0)
 
-    for word in wordlist:
-        if normalize(word['swahili']) == key:
-            word['status'] = 'h4'
-            word['due'] = due_time.isoformat()
-            break
+    current_word['status'] = 'h4'
+    current_word['due'] = due_time.isoformat()
+    update_word(username, current_word)
 
-    save_wordlist(username, wordlist)
-    session['learning_words'] = [
-        word for word in session['learning_words'] if normalize(word['swahili']) != key
+    session['learning_ids'] = [
+        word_id for word_id in session['learning_ids'] if word_id != current_word['id']
     ]
-    progress.pop(key, None)
+    progress.pop(str(current_word['id']), None)
 
 
 def prepare_learning_queue():
-    words = session.get('learning_words', [])
-    random.shuffle(words)
-    session['learning_queue'] = words.copy()
+    word_ids = list(session.get('learning_ids', []))
+    random.shuffle(word_ids)
+    session['learning_queue'] = word_ids
+    session['learning_cursor'] = 0
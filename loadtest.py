@@ -0,0 +1,328 @@
+# loadtest.py
+
+"""
+Load-tests a running server with many users studying at once.
+
+Usage:
+    python loadtest.py [--url http://127.0.0.1:5000] [--users 20]
+                       [--clients-per-user 1] [--duration 60] [--deck-size 500]
+                       [--learn-error-rate 0.2] [--review-error-rate 0.2]
+                       [--settle 2] [--cleanup]
+
+Run it from the app directory of the server under test (for compose.yml,
+the repository itself, which is mounted at /app), with the same
+SIMGUISTIC_STORAGE setting. It writes a synthetic wordlist for each user
+'loadtest-N' into 'users/', then starts a thread per client, each with its
+own cookie jar. Clients walk the learning page (presentation, testing,
+correction, correct) and the review page (testing, correction, correct)
+one whole session after another, answering wrongly in the testing state
+at the given error rates.
+
+At the end it reports throughput, p50/p99 latency of each state
+transition, HTTP errors and the largest cookie a client was sent. Then,
+after waiting --settle seconds for deferred writes, it reads every user's
+wordlist back through storage to check for corruption (unparseable rows,
+changed terms, invalid statuses or due dates) and for lost updates: words
+whose status is not what the clients' answers should have left. A word
+answered by more than one client of a user is only checked for
+corruption, since the order of their updates is not known.
+"""
+
+import argparse
+import csv
+import glob
+import html
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from datetime import datetime
+from http.cookiejar import CookieJar
+
+from benchmark import generate_deck
+from scheduling import TIME_INTERVALS, get_next_status
+
+MAX_STEPS = 5000  # Requests per session before a client gives up on it
+WRONG_ANSWER = 'wrong answer'
+
+_TERM = re.compile(r'<strong>(?:Translate into Swahili|English):</strong>\s*(.*?)</p>', re.S)
+_SWAHILI = re.compile(r'<strong>Swahili:</strong>\s*(.*?)</p>', re.S)
+_CORRECTION = re.compile(r'Correct translation:\s*(.*?)</span>', re.S)
+
+
+def page_state(body):
+    """
+    The state a learning or review page is in, from its HTML.
+    """
+    if 'presentation-form' in body:
+        return 'presentation'
+    if 'readonly' in body:
+        return 'correct'
+    if 'Correct translation:' in body:
+        return 'correction'
+    if 'Translate into Swahili:' in body:
+        return 'testing'
+    return 'completed'
+
+
+def _match(pattern, body):
+    match = pattern.search(body)
+    return html.unescape(match.group(1)).strip() if match else None
+
+
+def percentile(ordered, share):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+class UserModel:
+    """
+    What the clients of one user expect the wordlist to hold: the terms,
+    and the status each answered word should have been left at.
+    """
+
+    def __init__(self, username, rows):
+        self.username = username
+        self.rows = rows
+        self.answers = {}  # english -> swahili terms of the words with that english
+        for row in rows:
+            self.answers.setdefault(row['english'].strip(), []).append(row['swahili'])
+        self.statuses = {row['english'].strip(): row['status'] for row in rows}
+        self.expected = {}  # english -> (client, status)
+        self.shared = set()  # english answered by several clients
+        self.lock = threading.Lock()
+
+    def candidates(self, english):
+        return self.answers.get(english, [])
+
+    def graded(self, client, english, status):
+        with self.lock:
+            if len(self.answers.get(english, [])) != 1:
+                return  # Words sharing their english cannot be told apart
+            previous = self.expected.get(english)
+            if previous is not None and previous[0] != client:
+                self.shared.add(english)
+            self.expected[english] = (client, status)
+
+    def status(self, english):
+        with self.lock:
+            entry = self.expected.get(english)
+            return entry[1] if entry else self.statuses[english]
+
+
+class Client:
+    """
+    One browser: a cookie jar, walking learning and review sessions.
+    """
+
+    def __init__(self, url, model, index, args, results, stop):
+        self.url = url.rstrip('/')
+        self.model = model
+        self.index = index
+        self.args = args
+        self.results = results
+        self.stop = stop
+        self.rng = random.Random(f'{model.username}-{index}')
+        self.cookies = CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+        self.learned = {}  # english -> swahili seen on presentation or correction pages
+
+    def request(self, transition_from, route, data=None):
+        url = f'{self.url}/simguistic/{route}'
+        body = urllib.parse.urlencode(data).encode('utf-8') if data is not None else None
+        start = time.perf_counter()
+        try:
+            with self.opener.open(url, body, timeout=30) as response:
+                text = response.read().decode('utf-8')
+        except (urllib.error.URLError, OSError) as error:
+            status = error.code if isinstance(error, urllib.error.HTTPError) else type(error).__name__
+            self.results.error(f'{route} {transition_from}', status)
+            return None
+        elapsed = time.perf_counter() - start
+        state = page_state(text) if route in ('learn', 'review') else 'ok'
+        self.results.observe(f'{route} {transition_from}->{state}', elapsed)
+        self.results.cookie(sum(len(cookie.name) + len(cookie.value or '') for cookie in self.cookies))
+        return text
+
+    def correct_answer(self, english):
+        candidates = self.model.candidates(english)
+        if len(candidates) == 1:
+            return candidates[0]
+        # Several words share this english; guess, favouring the last one seen
+        return self.learned.get(english) or (self.rng.choice(candidates) if candidates else WRONG_ANSWER)
+
+    def run(self):
+        while not self.stop.is_set():
+            self.session('learn', self.args.learn_error_rate)
+            self.session('review', self.args.review_error_rate)
+
+    def session(self, route, error_rate):
+        # Finishing a session clears it, user included, so each one starts by choosing the user
+        if self.request('start', 'change_user', {'username': self.model.username}) is None:
+            return
+        body = self.request('start', route)
+        for _ in range(MAX_STEPS):
+            if body is None or self.stop.is_set():
+                return
+            state = page_state(body)
+            english = _match(_TERM, body)
+            if state == 'completed':
+                return
+            if state == 'presentation':
+                self.learned[english] = _match(_SWAHILI, body)
+                user_input = 'continue'
+            elif state == 'correction':
+                self.learned[english] = _match(_CORRECTION, body)
+                user_input = self.learned[english]
+            elif state == 'testing':
+                wrong = self.rng.random() < error_rate
+                user_input = WRONG_ANSWER if wrong else self.correct_answer(english)
+            else:
+                user_input = 'continue'
+
+            body = self.request(state, route, {'user_input': user_input})
+            if body is not None and state == 'testing':
+                self.track(route, english, page_state(body), body)
+
+    def track(self, route, english, outcome, body):
+        # Mirrors the status changes learning.py and review.py make
+        if route == 'review':
+            if outcome == 'correct':
+                self.model.graded(self.index, english, get_next_status(self.model.status(english)))
+            elif outcome == 'correction':
+                self.model.graded(self.index, english, 'h4')
+        elif outcome == 'correct' and 'New word learned!' in body:
+            self.model.graded(self.index, english, 'h4')
+
+
+class Results:
+    def __init__(self):
+        self.timings = {}
+        self.errors = Counter()
+        self.max_cookie = 0
+        self._lock = threading.Lock()
+
+    def observe(self, transition, elapsed):
+        with self._lock:
+            self.timings.setdefault(transition, []).append(elapsed)
+
+    def error(self, transition, status):
+        with self._lock:
+            self.errors[f'{transition} {status}'] += 1
+
+    def cookie(self, size):
+        if size > self.max_cookie:
+            self.max_cookie = size
+
+
+def verify(model):
+    """
+    Checks a user's stored wordlist against the model, returning a list of problems.
+    """
+    from storage import get_storage
+
+    try:
+        wordlist = get_storage().load(model.username)
+    except Exception as error:
+        return [f'unreadable wordlist: {error!r}']
+    problems = []
+    if len(wordlist) != len(model.rows):
+        problems.append(f'{len(wordlist)} words stored, {len(model.rows)} written')
+    for row, word in zip(model.rows, wordlist):
+        if (word['english'], word['swahili']) != (row['english'], row['swahili']):
+            problems.append(f"terms changed: {row['english']!r} is now {word['english']!r}")
+            continue
+        if word['status'] not in TIME_INTERVALS and word['status'] != '':
+            problems.append(f"invalid status {word['status']!r} for {row['english']!r}")
+        try:
+            if word['due']:
+                datetime.fromisoformat(word['due'])
+        except ValueError:
+            problems.append(f"invalid due date {word['due']!r} for {row['english']!r}")
+        english = row['english'].strip()
+        entry = model.expected.get(english)
+        if entry is not None and english not in model.shared and word['status'] != entry[1]:
+            problems.append(f"lost update: {english!r} is {word['status']!r}, expected {entry[1]!r}")
+    return problems
+
+
+def setup_user(username, size, rng):
+    path = os.path.join('users', f'{username}_wordlist.csv')
+    cleanup_user(username)
+    generate_deck(path, size, rng)
+    with open(path, newline='', encoding='utf-8') as f:
+        return UserModel(username, list(csv.DictReader(f)))
+
+
+def cleanup_user(username):
+    for path in glob.glob(os.path.join('users', f'{username}_*')) + glob.glob(os.path.join('users', 'cache', f'{username}_*')):
+        os.remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--clients-per-user', type=int, default=1,
+                        help='Concurrent clients studying as the same user')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to run for')
+    parser.add_argument('--deck-size', type=int, default=500)
+    parser.add_argument('--learn-error-rate', type=float, default=0.2)
+    parser.add_argument('--review-error-rate', type=float, default=0.2)
+    parser.add_argument('--settle', type=float, default=2,
+                        help='Seconds to wait for deferred writes before checking the wordlists')
+    parser.add_argument('--cleanup', action='store_true', help="Remove the test users' files afterwards")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    models = [setup_user(f'loadtest-{n}', args.deck_size, rng) for n in range(args.users)]
+    results = Results()
+    stop = threading.Event()
+    clients = [
+        Client(args.url, model, index, args, results, stop)
+        for model in models for index in range(args.clients_per_user)
+    ]
+    threads = [threading.Thread(target=client.run, daemon=True) for client in clients]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    requests = sum(len(timings) for timings in results.timings.values())
+    print(f'{len(clients)} clients, {requests} requests in {elapsed:.1f} s: {requests / elapsed:.1f} requests/s')
+    print(f'Largest cookie: {results.max_cookie} bytes')
+    print(f"{'transition':<36} {'n':>7} {'p50 ms':>9} {'p99 ms':>9}")
+    for transition, timings in sorted(results.timings.items()):
+        ordered = sorted(timings)
+        print(f'{transition:<36} {len(ordered):>7} {percentile(ordered, 0.5) * 1000:>9.1f} '
+              f'{percentile(ordered, 0.99) * 1000:>9.1f}')
+    for error, count in sorted(results.errors.items()):
+        print(f'error: {error} x{count}')
+
+    time.sleep(args.settle)
+    failed = 0
+    for model in models:
+        problems = verify(model)
+        checked = len(set(model.expected) - model.shared)
+        print(f'{model.username}: {checked} answered words checked, {len(problems)} problems')
+        for problem in problems[:10]:
+            print(f'  {problem}')
+        failed += bool(problems)
+        if args.cleanup:
+            cleanup_user(model.username)
+    return 1 if failed or results.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# locking.py
+
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows has no advisory file locks; fall back to in-process locking
+    fcntl = None
+
+LOCKS_DIR = 'users'
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+_held = threading.local()
+
+
+def _thread_lock(username):
+    with _thread_locks_guard:
+        lock = _thread_locks.get(username)
+        if lock is None:
+            lock = _thread_locks[username] = threading.Lock()
+        return lock
+
+
+@contextmanager
+def user_lock(username, shared=False):
+    """
+    Holds the per-user wordlist lock for the duration of the block.
+
+    The lock is an advisory lock on 'users/{username}_wordlist.lock', so it
+    also serialises writers in other gunicorn workers; within this process a
+    thread lock stands in for it when shared=False. Re-entering the lock in
+    the same thread is allowed, which lets a writer call a reader.
+    """
+    held = getattr(_held, 'users', None)
+    if held is None:
+        held = _held.users = {}
+    if username in held:
+        held[username] += 1
+        try:
+            yield
+        finally:
+            held[username] -= 1
+        return
+
+    thread_lock = None if shared else _thread_lock(username)
+    if thread_lock is not None:
+        thread_lock.acquire()
+    lock_file = None
+    try:
+        if fcntl is not None:
+            lock_file = open(os.path.join(LOCKS_DIR, f'{username}_wordlist.lock'), 'a')
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        held[username] = 1
+        try:
+            yield
+        finally:
+            del held[username]
+    finally:
+        if lock_file is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            lock_file.close()
+        if thread_lock is not None:
+            thread_lock.release()
+
+
+class _Batch:
+    def __init__(self):
+        self.words = []
+        self.done = False
+        self.result = None
+        self.error = None
+
+
+class GroupCommit:
+    """
+    Coalesces concurrent updates for the same user into one write.
+
+    The first thread to submit for a user becomes the leader and writes
+    every update queued by then; threads arriving while it writes wait,
+    and the leader writes their combined batch next. Later updates to the
+    same word win over earlier ones in the batch.
+    """
+
+    def __init__(self, write):
+        self._write = write
+        self._cond = threading.Condition()
+        self._current = {}  # username -> batch being filled
+        self._leaders = set()
+
+    def submit(self, username, words):
+        with self._cond:
+            batch = self._current.get(username)
+            if batch is None:
+                batch = self._current[username] = _Batch()
+            batch.words.extend(words)
+
+            if username in self._leaders:
+                while not batch.done:
+                    self._cond.wait()
+            else:
+                self._leaders.add(username)
+                try:
+                    while username in self._current:
+                        pending = self._current.pop(username)
+                        self._cond.release()
+                        try:
+                            coalesced = list({word['id']: word for word in pending.words}.values())
+                            pending.result = self._write(username, coalesced)
+                        except Exception as error:
+                            pending.error = error
+                        finally:
+                            self._cond.acquire()
+                        pending.done = True
+                        self._cond.notify_all()
+                finally:
+                    self._leaders.discard(username)
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.result
@@ -1,13 +1,22 @@
 # main.py
 
-from flask import Flask, render_template, request, redirect, url_for, send_file, abort
+from flask import Flask, render_template, request, redirect, url_for, abort, jsonify, Response, make_response
 from datetime import datetime
+import codecs
 import os
 
-from user_management import get_users, set_current_user, get_current_user
+from user_management import get_users, set_current_user, get_current_user, user_exists, create_user, get_decks
 from learning import start_learning_session, process_learning_input
 from review import start_review_session, process_review_input
-from wordlist_utils import get_word_counts, get_wordlist_filepath  # Import the new function
+from wordlist_utils import wordlist_exists, get_cache_stats, preload_decks
+from session_store import create_session_interface
+from api import fetch_review_cards, next_review_cards, next_learning_cards, apply_grades
+from importer import import_wordlist
+from grading import TYPO_MAX_EDITS
+from downloads import wordlist_response, iter_users_zip
+from render_cache import home_page, render_card, user_stats_row
+import history
+import metrics
 
 app = Flask(
     __name__,
@@ -16,71 +25,228 @@ app = Flask(
     static_url_path='/simguistic/static'
 )
 app.secret_key = 'your_secret_key'  # Use a secure random key in production
+# Keep session data on the server; the cookie only carries a signed session id
+app.session_interface = create_session_interface()
+# Per-request timings for /simguistic/metrics, when SIMGUISTIC_METRICS is set
+metrics.init_app(app)
+# Warm every user's deck snapshot and cache entry as the worker starts
+if os.environ.get('SIMGUISTIC_PRELOAD'):
+    preload_decks(get_users())
 
 @app.route('/simguistic')
 def home():
+    # The ETag covers every user's deck version, so an unchanged page is a 304
+    etag, render = home_page(get_users(), get_current_user(), get_decks())
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')  # The selected user is part of the page
+    return response
+
+def render_home(error=None, message=None):
     users = get_users()
-    current_user = get_current_user()
-    user_stats = {}
-    for user in users:
-        total_learned, due_for_review, not_learned = get_word_counts(user)
-        user_stats[user] = {
-            'total_learned': total_learned,
-            'due_for_review': due_for_review,
-            'not_learned': not_learned
-        }
-    return render_template('home.html', users=users, current_user=current_user, user_stats=user_stats)
+    rows = [user_stats_row(user) for user in users]
+    return render_template('home.html', users=users, current_user=get_current_user(), user_rows=rows,
+                           decks=get_decks(), error=error, message=message)
 
 @app.route('/simguistic/change_user', methods=['POST'])
 def change_user():
-    username = request.form['username']
+    username = request.form.get('username', '')
+    if not user_exists(username):
+        abort(400, description="Unknown user")
+    set_current_user(username)
+    return redirect(url_for('home'))
+
+@app.route('/simguistic/create_user', methods=['POST'])
+def create_user_route():
+    """
+    Creates a user on a base deck and selects them.
+    """
+    username = request.form.get('username', '').strip().lower()
+    try:
+        create_user(username, request.form.get('deck', ''))
+    except ValueError as e:
+        return render_home(error=str(e)), 400
     set_current_user(username)
     return redirect(url_for('home'))
 
+@app.route('/simguistic/import_wordlist', methods=['POST'])
+def import_wordlist_route():
+    """
+    Streams an uploaded CSV or TSV file into the current user's wordlist.
+    """
+    username = get_current_user()
+    if not username:
+        return redirect(url_for('home'))
+    upload = request.files.get('wordlist')
+    if upload is None or not upload.filename:
+        return render_home(error='Choose a CSV or TSV file to import.'), 400
+
+    # Decode as the upload is read; it is never loaded whole
+    textfile = codecs.getreader('utf-8-sig')(upload.stream)
+    try:
+        result = import_wordlist(username, textfile)
+    except (ValueError, UnicodeDecodeError) as e:
+        return render_home(error=f'Import failed: {e}'), 400
+    message = (f"Imported {result['added']} of {result['rows']} rows "
+               f"({result['duplicates']} duplicates, {result['invalid']} invalid).")
+    return render_home(error=' '.join(result['errors']) or None, message=message)
+
 @app.route('/simguistic/learn', methods=['GET', 'POST'])
 def learn():
+    if request.method == 'GET' and request.args.get('mode') == 'prefetch':
+        # Cards are fetched in batches and graded in the page, without reloads
+        return render_card('cards.html', mode='learn', typo_max_edits=TYPO_MAX_EDITS)
     if request.method == 'POST':
         user_input = request.form['user_input']
         result = process_learning_input(user_input)
-        return render_template('learn.html', **result)
+        return render_card('learn.html', **result)
     else:
         result = start_learning_session()
-        return render_template('learn.html', **result)
+        return render_card('learn.html', **result)
 
 @app.route('/simguistic/review', methods=['GET', 'POST'])
 def review():
+    if request.method == 'GET' and request.args.get('mode') == 'prefetch':
+        # Cards are fetched in batches and graded in the page, without reloads
+        return render_card('cards.html', mode='review', typo_max_edits=TYPO_MAX_EDITS)
     if request.method == 'POST':
         user_input = request.form['user_input']
         result = process_review_input(user_input)
-        return render_template('review.html', **result)
+        return render_card('review.html', **result)
     else:
         result = start_review_session()
-        return render_template('review.html', **result)
+        return render_card('review.html', **result)
 
-@app.route('/simguistic/download_wordlist', methods=['POST'])
+@app.route('/simguistic/download_wordlist', methods=['GET', 'POST'])
 def download_wordlist():
     """
-    Serves the wordlist CSV file for the current user.
+    Serves the wordlist of the current user as a CSV file.
     """
     username = get_current_user()
     if not username:
         # Redirect to home if no user is selected
         return redirect(url_for('home'))
 
-    # Get the filepath for the user's wordlist
-    filepath = get_wordlist_filepath(username)
-    if not os.path.exists(filepath):
-        # Return a 404 error if the file does not exist
+    if not wordlist_exists(username):
+        # Return a 404 error if the user has no stored wordlist
         abort(404, description="Wordlist file not found")
 
-    # Serve the file for download
-    return send_file(
-        filepath,
-        as_attachment=True,
-        download_name=f'{username}_wordlist.csv'
+    # Streamed from whichever storage backend holds it; GETs can be revalidated
+    return wordlist_response(username)
+
+@app.route('/simguistic/export_all')
+def export_all():
+    """
+    Streams a zip archive with the wordlists of all users.
+    """
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    return Response(
+        iter_users_zip(get_users()),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="simguistic-wordlists-{stamp}.zip"'}
     )
 
 
+@app.route('/simguistic/api/review/cards')
+def api_review_cards():
+    """
+    Returns a batch of due cards as JSON, with answers and answer hashes
+    so the client can grade them itself.
+    """
+    username = get_current_user()
+    if not username:
+        return jsonify({'error': 'No user selected.'}), 401
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({'cards': fetch_review_cards(username, limit)})
+
+@app.route('/simguistic/api/review/next')
+def api_review_next():
+    """
+    Returns the next cards of the session's review queue, for prefetching.
+    """
+    username = get_current_user()
+    if not username:
+        return jsonify({'error': 'No user selected.'}), 401
+    count = request.args.get('count', 5, type=int)
+    restart = request.args.get('restart') == '1'
+    return jsonify({'cards': next_review_cards(username, count, restart)})
+
+@app.route('/simguistic/api/learn/next')
+def api_learn_next():
+    """
+    Starts a learning round and returns its cards.
+    """
+    username = get_current_user()
+    if not username:
+        return jsonify({'error': 'No user selected.'}), 401
+    return jsonify({'cards': next_learning_cards(username)})
+
+@app.route('/simguistic/api/grades', methods=['POST'])
+def api_grades():
+    """
+    Applies a batch of client-graded results in one storage update.
+    """
+    username = get_current_user()
+    if not username:
+        return jsonify({'error': 'No user selected.'}), 401
+    payload = request.get_json(silent=True) or {}
+    results = payload.get('results')
+    if not isinstance(results, list):
+        return jsonify({'error': 'Expected a JSON object with a list of results.'}), 400
+    return jsonify(apply_grades(username, results))
+
+@app.route('/simguistic/api/history/retention')
+def api_history_retention():
+    """
+    Returns the share of right review answers at each interval step.
+    """
+    username = get_current_user()
+    if not username:
+        return jsonify({'error': 'No user selected.'}), 401
+    return jsonify({'retention': history.retention(username)})
+
+@app.route('/simguistic/api/history/hardest')
+def api_history_hardest():
+    """
+    Returns the ids of the words answered wrongly most often.
+    """
+    username = get_current_user()
+    if not username:
+        return jsonify({'error': 'No user selected.'}), 401
+    limit = max(1, min(request.args.get('limit', 20, type=int), 200))
+    return jsonify({'words': history.hardest_words(username, limit)})
+
+@app.route('/simguistic/api/history/forecast')
+def api_history_forecast():
+    """
+    Returns the number of reviews falling due on each of the coming days.
+    """
+    username = get_current_user()
+    if not username:
+        return jsonify({'error': 'No user selected.'}), 401
+    days = max(1, min(request.args.get('days', history.FORECAST_DAYS, type=int), 365))
+    return jsonify({'forecast': history.due_forecast(username, days)})
+
+@app.route('/simguistic/metrics')
+def metrics_endpoint():
+    """
+    Exposes request timings, storage byte counts and cache figures for Prometheus.
+    """
+    if not metrics.ENABLED:
+        abort(404, description="Metrics are disabled")
+    cache = get_cache_stats()
+    extra = {
+        f'simguistic_wordlist_cache_{name}': (
+            'gauge' if name in ('entries', 'bytes') else 'counter', f'Wordlist cache {name}.', value
+        )
+        for name, value in cache.items()
+    }
+    return Response(metrics.render_prometheus(extra), mimetype='text/plain; version=0.0.4')
+
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,247 @@
+# metrics.py
+
+"""
+Opt-in request instrumentation, enabled by setting SIMGUISTIC_METRICS=1.
+
+Storage, session and template work inside a request is timed by stage.
+Each response carries a Server-Timing header with that breakdown. Latency
+per route is kept as a histogram and as p50/p95/p99 over recent requests.
+Bytes read and written are counted per user. Everything is exposed in the
+Prometheus text format at /simguistic/metrics. Requests slower than
+SIMGUISTIC_SLOW_REQUEST_MS milliseconds are logged with their breakdown.
+Figures are per process; each gunicorn worker reports its own.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+
+ENABLED = bool(os.environ.get('SIMGUISTIC_METRICS'))
+SLOW_REQUEST_MS = float(os.environ.get('SIMGUISTIC_SLOW_REQUEST_MS', 0)) or None
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUANTILES = (0.5, 0.95, 0.99)
+RESERVOIR_SIZE = 1024  # Recent latencies kept per route for the quantiles
+
+
+class RouteStats:
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def quantile(self, q):
+        ordered = sorted(self.recent)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Registry:
+    def __init__(self):
+        self.routes = {}  # (method, route) -> RouteStats
+        self.stages = {}  # stage -> [count, seconds]
+        self.user_bytes = {}  # (username, direction) -> bytes
+        self._lock = threading.Lock()
+
+    def observe_request(self, method, route, seconds, stages):
+        with self._lock:
+            stats = self.routes.get((method, route))
+            if stats is None:
+                stats = self.routes[(method, route)] = RouteStats()
+            stats.observe(seconds)
+            for stage, stage_seconds in stages.items():
+                self._observe_stage(stage, stage_seconds)
+
+    def observe_stage(self, stage, seconds):
+        with self._lock:
+            self._observe_stage(stage, seconds)
+
+    def _observe_stage(self, stage, seconds):
+        totals = self.stages.setdefault(stage, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+
+    def add_bytes(self, username, direction, count):
+        with self._lock:
+            key = (username, direction)
+            self.user_bytes[key] = self.user_bytes.get(key, 0) + count
+
+
+registry = Registry()
+
+
+@contextmanager
+def timer(stage):
+    """
+    Adds the time spent in the block to the current request's breakdown.
+    """
+    if not ENABLED or not has_request_context():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = g.setdefault('stage_timings', {})
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def add_bytes(username, direction, count):
+    """
+    Counts bytes read from or written to a user's storage.
+    """
+    if ENABLED:
+        registry.add_bytes(username, direction, count)
+
+
+class InstrumentedSessionInterface:
+    """
+    Wraps a session interface to time session loads and saves.
+    """
+
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def open_session(self, app, request):
+        start = time.perf_counter()
+        session = self.wrapped.open_session(app, request)
+        # g does not exist yet when the session is opened, so keep the figure on the request
+        request.environ['simguistic.session_load'] = time.perf_counter() - start
+        return session
+
+    def save_session(self, app, session, response):
+        # Runs after the response is final, so it is counted apart from the request
+        start = time.perf_counter()
+        try:
+            return self.wrapped.save_session(app, session, response)
+        finally:
+            registry.observe_stage('session_save', time.perf_counter() - start)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(extra=None):
+    """
+    Renders the collected metrics in the Prometheus text exposition format.
+    'extra' maps further metric names to (type, help, value).
+    """
+    lines = [
+        '# HELP simguistic_request_duration_seconds Request latency per route.',
+        '# TYPE simguistic_request_duration_seconds histogram',
+    ]
+    with registry._lock:
+        routes = sorted(registry.routes.items())
+        stages = sorted(registry.stages.items())
+        user_bytes = sorted(registry.user_bytes.items())
+        quantiles = {key: [stats.quantile(q) for q in QUANTILES] for key, stats in routes}
+    for (method, route), stats in routes:
+        labels = f'method="{_escape(method)}",route="{_escape(route)}"'
+        cumulative = 0
+        for bound, count in zip(BUCKETS, stats.bucket_counts):
+            cumulative += count
+            lines.append(f'simguistic_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'simguistic_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+        lines.append(f'simguistic_request_duration_seconds_sum{{{labels}}} {stats.total}')
+        lines.append(f'simguistic_request_duration_seconds_count{{{labels}}} {stats.count}')
+
+    lines += [
+        '# HELP simguistic_request_latency_seconds Latency quantiles over recent requests per route.',
+        '# TYPE simguistic_request_latency_seconds summary',
+    ]
+    for (method, route), stats in routes:
+        labels = f'method="{_escape(method)}",route="{_escape(route)}"'
+        for q, value in zip(QUANTILES, quantiles[(method, route)]):
+            lines.append(f'simguistic_request_latency_seconds{{{labels},quantile="{q}"}} {value}')
+        lines.append(f'simguistic_request_latency_seconds_sum{{{labels}}} {stats.total}')
+        lines.append(f'simguistic_request_latency_seconds_count{{{labels}}} {stats.count}')
+
+    lines += [
+        '# HELP simguistic_stage_seconds_total Time spent per stage of request handling.',
+        '# TYPE simguistic_stage_seconds_total counter',
+    ]
+    for stage, (_, seconds) in stages:
+        lines.append(f'simguistic_stage_seconds_total{{stage="{_escape(stage)}"}} {seconds}')
+    lines += [
+        '# HELP simguistic_stage_calls_total Requests that spent time in each stage.',
+        '# TYPE simguistic_stage_calls_total counter',
+    ]
+    for stage, (count, _) in stages:
+        lines.append(f'simguistic_stage_calls_total{{stage="{_escape(stage)}"}} {count}')
+
+    lines += [
+        '# HELP simguistic_storage_bytes_total Bytes read from and written to wordlist storage per user.',
+        '# TYPE simguistic_storage_bytes_total counter',
+    ]
+    for (username, direction), count in user_bytes:
+        lines.append(
+            f'simguistic_storage_bytes_total{{user="{_escape(username)}",direction="{direction}"}} {count}'
+        )
+
+    for name, (metric_type, help_text, value) in sorted((extra or {}).items()):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}', f'{name} {value}']
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app):
+    """
+    Installs the request hooks when SIMGUISTIC_METRICS is set.
+    """
+    if not ENABLED:
+        return
+
+    app.session_interface = InstrumentedSessionInterface(app.session_interface)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        g.stage_timings = {'session_load': request.environ.get('simguistic.session_load', 0.0)}
+
+    @before_render_template.connect_via(app)
+    def start_render_timer(sender, template, context, **extra):
+        g.render_start = time.perf_counter()
+
+    @template_rendered.connect_via(app)
+    def stop_render_timer(sender, template, context, **extra):
+        start = g.pop('render_start', None)
+        if start is not None:
+            timings = g.setdefault('stage_timings', {})
+            timings['render'] = timings.get('render', 0.0) + time.perf_counter() - start
+
+    @app.after_request
+    def record_request(response):
+        start = g.get('request_start')
+        if start is None:
+            return response
+        # The session is saved after this hook, so its time is not in the total or the header
+        elapsed = time.perf_counter() - start
+        stages = g.get('stage_timings', {})
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        registry.observe_request(request.method, route, elapsed, stages)
+        response.headers['Server-Timing'] = ', '.join(
+            [f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in stages.items()]
+            + [f'total;dur={elapsed * 1000:.2f}']
+        )
+        if SLOW_REQUEST_MS is not None and elapsed * 1000 >= SLOW_REQUEST_MS:
+            breakdown = ', '.join(f'{stage}={seconds * 1000:.1f}ms' for stage, seconds in stages.items())
+            app.logger.warning('Slow request %s %s took %.1fms (%s)',
+                               request.method, request.path, elapsed * 1000, breakdown)
+        return response
@@ -0,0 +1,143 @@
+# render_cache.py
+
+"""
+Caches for rendered markup.
+
+A user's row in the home page's progress table is rendered again only
+when their deck version or word counts change. Whole home pages are kept
+per ETag, which covers every row's version and counts, so an unchanged
+page is served without rendering or answered with 304.
+
+The learning, review and card pages are rendered once per template,
+state and set of non-empty fields, with placeholders for the card's text.
+Later requests only escape their text into that skeleton.
+"""
+
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+
+from flask import render_template, request
+from markupsafe import Markup, escape
+
+from wordlist_utils import get_deck_version, get_word_counts
+
+MAX_ROWS = 1024  # Users whose progress rows are kept
+MAX_PAGES = 64  # Rendered home pages kept
+LITERAL_FIELDS = ('state', 'mode')  # Card fields templates compare, rendered as they are
+
+_PLACEHOLDER = re.compile('\x00(\\w+)\x00')
+
+
+class LruCache:
+    """
+    Small thread-safe LRU mapping.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_rows = LruCache(MAX_ROWS)  # username -> (version key, row markup)
+_pages = LruCache(MAX_PAGES)  # ETag -> page
+_skeletons = {}  # skeleton key -> literal and placeholder parts, or None if not cacheable
+_skeletons_lock = threading.Lock()
+
+
+def _row_key(username):
+    return [get_deck_version(username), get_word_counts(username)]
+
+
+def user_stats_row(username, key=None):
+    """
+    The user's row of the progress table, rendered again only once their
+    deck or word counts have changed.
+    """
+    key = key if key is not None else _row_key(username)
+    cached = _rows.get(username)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    total_learned, due_for_review, not_learned = key[1]
+    row = Markup(render_template(
+        'user_stats_row.html', user=username, total_learned=total_learned,
+        due_for_review=due_for_review, not_learned=not_learned
+    ))
+    _rows.put(username, (key, row))
+    return row
+
+
+def home_page(users, current_user, decks):
+    """
+    Returns the ETag of the home page without errors or messages, and a
+    function rendering it. Pages are kept per ETag.
+    """
+    keys = [_row_key(user) for user in users]
+    state = [users, keys, current_user, decks, request.script_root]
+    etag = hashlib.sha1(json.dumps(state).encode('utf-8')).hexdigest()[:20]
+
+    def render():
+        page = _pages.get(etag)
+        if page is None:
+            rows = [user_stats_row(user, key) for user, key in zip(users, keys)]
+            page = render_template('home.html', users=users, current_user=current_user, user_rows=rows,
+                                   decks=decks, error=None, message=None)
+            _pages.put(etag, page)
+        return page
+
+    return etag, render
+
+
+def _skeleton(template_name, context, key):
+    # Renders the template with placeholders for the non-empty text fields,
+    # and splits it into alternating literal markup and field names
+    placeholders = {
+        name: f'\x00{name}\x00' for name, value in context.items()
+        if isinstance(value, str) and value and name not in LITERAL_FIELDS
+    }
+    markup = render_template(template_name, **dict(context, **placeholders))
+    parts = _PLACEHOLDER.split(markup)
+    # A placeholder a template altered, say with a filter, cannot be substituted
+    if any('\x00' in literal for literal in parts[::2]) or not set(parts[1::2]) <= set(placeholders):
+        parts = None
+    with _skeletons_lock:
+        _skeletons[key] = parts
+    return parts
+
+
+def render_card(template_name, **context):
+    """
+    render_template for the card pages, filling a cached skeleton of the
+    page with the context's escaped text.
+    """
+    key = (template_name, request.script_root) + tuple(sorted(
+        (name, bool(value)) if isinstance(value, str) and name not in LITERAL_FIELDS else (name, repr(value))
+        for name, value in context.items()
+    ))
+    try:
+        parts = _skeletons[key]
+    except KeyError:
+        parts = _skeleton(template_name, context, key)
+    if parts is None:
+        return render_template(template_name, **context)
+    return ''.join(
+        part if index % 2 == 0 else str(escape(context[part]))
+        for index, part in enumerate(parts)
+    )
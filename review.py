@@ -1,60 +1,31 @@
 # review.py
 
 from flask import session
-from datetime import datetime, timedelta
+from datetime import datetime
 import random
-import string  # Import string module
 
 from user_management import get_current_user
-from wordlist_utils import load_wordlist, save_wordlist
-
-TIME_INTERVALS = ['h4', 'h24', 'd6', 'd12', 'd24', 'd48', 'd96', 'd180']
-TIME_DELTAS = {
-    'h4': timedelta(hours=4),
-    'h24': timedelta(hours=24),
-    'd6': timedelta(days=6),
-    'd12': timedelta(days=12),
-    'd24': timedelta(days=24),
-    'd48': timedelta(days=48),
-    'd96': timedelta(days=96),
-    'd180': timedelta(days=180),
-}
-
-def normalize(text):
-    # Helper function to remove punctuation and convert to lowercase
-    translator = str.maketrans('', '', string.punctuation)
-    return text.translate(translator).strip().lower()
+from scheduling import TIME_DELTAS, get_next_status
+from grading import CLOSE, WRONG, grade_answer
+from history import REVIEW, record
+from wordlist_utils import get_due_chunk, get_word, load_deck, update_word, get_other_card_hint
+
+REVIEW_CHUNK = 20  # Due words loaded into the session at a time
 
 def start_review_session():
     username = get_current_user()
     if not username:
         return {'error': 'No user selected.'}
 
-    wordlist = load_wordlist(username)
-    now = datetime.now()
-    due_words = []
-
-    for word in wordlist:
-        if word['status']:
-            due_str = word.get('due', '')
-            if due_str:
-                due_datetime = datetime.fromisoformat(due_str)
-                if due_datetime <= now:
-                    due_words.append(word)
-            else:
-                due_words.append(word)
-
-    if not due_words:
+    # Only word ids live in the session, a chunk at a time, so a long
+    # backlog of due words costs no more to start than a short one
+    session['review_after'] = None
+    session['review_retry'] = []
+    if not refill_review_queue(username):
         return {'message': 'No words are due for review!'}
-
-    session['review_words'] = due_words
-    session['review_queue'] = []
     session['review_state'] = 'testing'
 
-    prepare_review_queue()
-
-    current_word = session['review_queue'].pop(0)
-    session['current_review_word'] = current_word
+    current_word = next_review_word(username)
 
     return {
         'english_word': current_word['english'],
@@ -66,39 +37,35 @@ def process_review_input(user_input):
     if not username:
         return {'error': 'No user selected.'}
 
-    current_word = session.get('current_review_word')
+    current_id = session.get('current_review_id')
+    current_word = get_word(username, current_id) if current_id is not None else None
     if not current_word:
         return {'error': 'No word is currently being reviewed.'}
 
     review_state = session.get('review_state', 'testing')
     correct_translation = current_word['swahili']
 
-    # Normalize user input and correct translation
-    user_input_clean = normalize(user_input)
-    correct_answer = normalize(correct_translation)
+    # Compare normalized answers, tolerating typos if that is enabled
+    grade = grade_answer(user_input, correct_translation, load_deck(username))
 
-    wordlist = load_wordlist(username)
     now = datetime.now()
 
     if review_state == 'testing':
-        if user_input_clean == correct_answer:
+        current_status = current_word['status']
+        if grade != WRONG:
             # Correct input
             # Update the word's status to the next interval
-            current_status = current_word['status']
             next_status = get_next_status(current_status)
             current_word['status'] = next_status
 
             # Update 'due' date
             current_word['due'] = (now + TIME_DELTAS[next_status]).isoformat()
 
-            # Update the word in the wordlist
-            update_word_in_wordlist(wordlist, current_word)
-            save_wordlist(username, wordlist)
-
-            # Remove word from review_words
-            session['review_words'] = [word for word in session['review_words'] if word['swahili'] != current_word['swahili']]
+            # Persist the word's new status; it is done for this session
+            update_word(username, current_word)
+            record(username, current_word, current_status, grade, REVIEW)
 
-            message = 'Correct!'
+            message = f'Correct! (Spelling: {correct_translation})' if grade == CLOSE else 'Correct!'
             session['review_state'] = 'correct'
             session['last_user_input'] = user_input
 
@@ -115,9 +82,12 @@ def process_review_input(user_input):
             current_word['status'] = 'h4'
             current_word['due'] = (now + TIME_DELTAS['h4']).isoformat()
 
-            # Update the word in the wordlist
-            update_word_in_wordlist(wordlist, current_word)
-            save_wordlist(username, wordlist)
+            # Persist the word's new status
+            update_word(username, current_word)
+            record(username, current_word, current_status, grade, REVIEW)
+
+            # Ask the word again once the due words have been gone through
+            session['review_retry'] = session.get('review_retry', []) + [current_id]
 
             # Do not move to next word; ask user to input the correct translation
             session['review_state'] = 'correction'
@@ -129,11 +99,12 @@ def process_review_input(user_input):
                 'user_input': user_input,
                 'correct_translation': correct_translation,
                 'error': 'Incorrect.',
+                'hint': get_other_card_hint(username, user_input, current_id),
                 'state': 'correction'
             }
 
     elif review_state == 'correction':
-        if user_input_clean == correct_answer:
+        if grade != WRONG:
             # User has now input the correct translation
             message = 'Correct!'
             session['review_state'] = 'correct'
@@ -158,11 +129,8 @@ def process_review_input(user_input):
 
     elif review_state == 'correct':
         # Move on to next word
-        if session['review_words'] or session['review_queue']:
-            if not session['review_queue']:
-                prepare_review_queue()
-            next_word = session['review_queue'].pop(0)
-            session['current_review_word'] = next_word
+        if session['review_cursor'] < len(session['review_queue']) or refill_review_queue(username):
+            next_word = next_review_word(username)
             session['review_state'] = 'testing'
             return {
                 'english_word': next_word['english'],
@@ -175,24 +143,24 @@ def process_review_input(user_input):
                 'state': 'completed'
             }
 
-def prepare_review_queue():
-    words = session.get('review_words', [])
-    random.shuffle(words)
-    session['review_queue'] = words.copy()
-
-def get_next_status(current_status):
-    if current_status in TIME_INTERVALS:
-        index = TIME_INTERVALS.index(current_status)
-        if index + 1 < len(TIME_INTERVALS):
-            return TIME_INTERVALS[index + 1]
-        else:
-            return TIME_INTERVALS[-1]
-    else:
-        return 'h4'
-
-def update_word_in_wordlist(wordlist, updated_word):
-    for word in wordlist:
-        if word['swahili'] == updated_word['swahili']:
-            word['status'] = updated_word['status']
-            word['due'] = updated_word['due']
-            break
+def refill_review_queue(username):
+    """
+    Loads the next chunk of due words into the queue, or once there are
+    none left, the words answered wrongly so far. Returns False when there
+    is nothing left to review.
+    """
+    word_ids, session['review_after'] = get_due_chunk(username, REVIEW_CHUNK, session.get('review_after'))
+    if not word_ids:
+        word_ids = session.get('review_retry', [])
+        session['review_retry'] = []
+    random.shuffle(word_ids)
+    session['review_queue'] = word_ids
+    session['review_cursor'] = 0
+    return bool(word_ids)
+
+def next_review_word(username):
+    cursor = session['review_cursor']
+    next_word = get_word(username, session['review_queue'][cursor])
+    session['review_cursor'] = cursor + 1
+    session['current_review_id'] = next_word['id']
+    return next_word
@@ -0,0 +1,218 @@
+# scheduler.py
+
+"""
+Reschedules due dates across whole decks to smooth out the review load.
+
+Usage:
+    python scheduler.py [USERNAME ...] [--max-per-day 100] [--fuzz F]
+                        [--dry-run]
+
+Words learned in one session come due at almost the same moment, and do
+so again at every later step, so reviews arrive in spikes. For each user
+(every user when none are named) the job:
+
+- with --fuzz F, moves each future due date by a share of its interval
+  between -F and +F. The shares are drawn from a generator seeded with
+  the deck's statuses and due dates, so a run is reproducible. Each run
+  shifts the words again, so fuzzing is meant as a one-off rather than a
+  nightly job.
+- caps the reviews falling due on each future day at --max-per-day. The
+  excess moves to the nearest day with room, in whole days so a review
+  keeps its time of day. A word moves by at most SPREAD of its interval,
+  never onto today, and words at h4 or h24 stay put. Days under the cap
+  are left alone, so running the job again changes nothing.
+
+Both steps work a column at a time: day numbers, fuzz offsets and daily
+counts are each computed in one pass over the deck's arrays, and only the
+words on days over the cap are looked at one by one.
+
+Run it from the app directory, where 'users/' lives. Each user's deck is
+read and written under their wordlist lock, so grades given meanwhile are
+written after the job and are not lost. Moved words are also recorded in
+the users' histories, which the due forecast is computed from.
+"""
+
+import argparse
+import hashlib
+import operator
+import random
+import sys
+import time
+from array import array
+from collections import Counter
+from itertools import compress
+
+from deck import epoch_to_due
+from history import SCHEDULER, append, entry
+from locking import user_lock
+from scheduling import TIME_DELTAS, TIME_INTERVALS
+from user_management import get_users, user_exists
+from wordlist_utils import load_deck, update_words
+
+DAY = 24 * 60 * 60
+MAX_PER_DAY = 100  # Reviews a user should have due on any one day
+SPREAD = 0.1  # Largest move, as a share of the word's interval
+
+_UNIT_SCALE = 2.0 ** -63  # Scales a random 64-bit integer to [0, 2)
+
+
+def _by_code(values):
+    # A table indexed by every status code, with 0 for NEW and OTHER
+    table = array('q', [0]) * 256
+    for code, value in enumerate(values, start=1):
+        table[code] = value
+    return table
+
+
+INTERVAL_SECONDS = _by_code(int(TIME_DELTAS[status].total_seconds()) for status in TIME_INTERVALS)
+MAX_SHIFT_DAYS = _by_code(round(INTERVAL_SECONDS[code] * SPREAD / DAY) for code in range(1, len(TIME_INTERVALS) + 1))
+
+
+def _day(due_ts, utc_offset):
+    return (due_ts + utc_offset) // DAY
+
+
+def day_numbers(due, utc_offset):
+    """
+    The local day number of each due time; undated words fall before today.
+    """
+    return array('q', [(due_ts + utc_offset) // DAY for due_ts in due])
+
+
+def _units(status, due):
+    # A column of pseudo-random 64-bit integers, drawn in one call from a
+    # generator seeded with the deck's columns, so a run is reproducible
+    seed = hashlib.blake2b(bytes(status) + due.tobytes(), digest_size=16).digest()
+    units = array('Q')
+    units.frombytes(random.Random(seed).getrandbits(64 * len(due)).to_bytes(8 * len(due), 'little'))
+    return units
+
+
+def fuzz_dues(status, due, now_ts, fraction):
+    """
+    Returns a copy of the due column with each future due date of a word on
+    the ladder moved by up to 'fraction' of its interval either way.
+    Due dates that would move into the past are kept as they are.
+    """
+    if not len(due):
+        return array('q')
+    spans = [fraction * INTERVAL_SECONDS[code] for code in status]
+    shifted = [
+        due_ts + int((unit * _UNIT_SCALE - 1.0) * span)
+        for due_ts, unit, span in zip(due, _units(status, due), spans)
+    ]
+    return array('q', [
+        moved if due_ts > now_ts and moved > now_ts else due_ts
+        for due_ts, moved in zip(due, shifted)
+    ])
+
+
+def daily_load(status, due, now_ts, utc_offset, days=None):
+    """
+    Counts the learned words falling due on each day after today.
+    'days' is the due column's day_numbers, if already computed.
+    """
+    if days is None:
+        days = day_numbers(due, utc_offset)
+    today = _day(now_ts, utc_offset)
+    counts = Counter(compress(days, status))
+    return Counter({day: count for day, count in counts.items() if day > today})
+
+
+def _day_with_room(counts, day, max_shift, today, max_per_day):
+    # The nearest day within max_shift with room, trying later before earlier
+    for offset in range(1, max_shift + 1):
+        for candidate in (day + offset, day - offset):
+            if candidate > today and counts[candidate] < max_per_day:
+                return candidate
+    return None
+
+
+def cap_daily_load(status, due, now_ts, max_per_day, utc_offset):
+    """
+    Returns a copy of the due column in which no day after today has more
+    than max_per_day words due, as far as the words' spread allows. Only the
+    words on days over the limit are looked at one by one.
+    """
+    today = _day(now_ts, utc_offset)
+    days = day_numbers(due, utc_offset)
+    counts = daily_load(status, due, now_ts, utc_offset, days)
+    capped = array('q', due)
+    overfull = {day for day, count in counts.items() if count > max_per_day}
+    if not overfull:
+        return capped
+
+    movable = {}  # overfull day -> ids of words that may move off it
+    shifts = map(MAX_SHIFT_DAYS.__getitem__, status)
+    candidates = map(operator.and_, map(bool, shifts), map(overfull.__contains__, days))
+    for word_id in compress(range(len(status)), candidates):
+        movable.setdefault(days[word_id], []).append(word_id)
+
+    for day in sorted(movable):
+        excess = counts[day] - max_per_day
+        # Words with the most room to move go first, in a fixed order
+        for word_id in sorted(movable[day], key=lambda word_id: (-MAX_SHIFT_DAYS[status[word_id]], word_id)):
+            target = _day_with_room(counts, day, MAX_SHIFT_DAYS[status[word_id]], today, max_per_day)
+            if target is None:
+                continue
+            counts[day] -= 1
+            counts[target] += 1
+            capped[word_id] = due[word_id] + (target - day) * DAY
+            excess -= 1
+            if not excess:
+                break
+    return capped
+
+
+def reschedule_user(username, max_per_day=MAX_PER_DAY, fuzz=0.0, now_ts=None, dry_run=False):
+    """
+    Fuzzes and caps one user's due dates, writing the moved words in one
+    update. Returns the number of words moved and the busiest day's
+    review count before and after.
+    """
+    if now_ts is None:
+        now_ts = int(time.time())
+    utc_offset = time.localtime(now_ts).tm_gmtoff  # Days follow local midnight
+    with user_lock(username):
+        deck = load_deck(username)
+        due = deck.due
+        if fuzz:
+            due = fuzz_dues(deck.status, due, now_ts, fuzz)
+        due = cap_daily_load(deck.status, due, now_ts, max_per_day, utc_offset)
+
+        words = []
+        for word_id in compress(range(len(deck)), map(operator.ne, due, deck.due)):
+            word = deck.word(word_id)
+            word['due'] = epoch_to_due(due[word_id])
+            words.append(word)
+        peak_before = max(daily_load(deck.status, deck.due, now_ts, utc_offset).values(), default=0)
+        peak_after = max(daily_load(deck.status, due, now_ts, utc_offset).values(), default=0)
+        if words and not dry_run:
+            update_words(username, words)
+            append(username, [entry(word, word['status'], None, SCHEDULER, now_ts) for word in words])
+    return {'moved': len(words), 'peak_before': peak_before, 'peak_after': peak_after}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('usernames', nargs='*', help='Users to reschedule; all users by default')
+    parser.add_argument('--max-per-day', type=int, default=MAX_PER_DAY)
+    parser.add_argument('--fuzz', type=float, default=0.0, help='Largest fuzz, as a share of the interval')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would move without writing')
+    args = parser.parse_args(argv)
+
+    usernames = args.usernames or get_users()
+    unknown = [username for username in usernames if not user_exists(username)]
+    if unknown:
+        parser.error(f"Unknown users: {', '.join(unknown)}")
+
+    now_ts = int(time.time())
+    for username in usernames:
+        result = reschedule_user(username, args.max_per_day, args.fuzz, now_ts, args.dry_run)
+        print(f"{username}: {result['moved']} words moved, busiest day "
+              f"{result['peak_before']} -> {result['peak_after']} reviews")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
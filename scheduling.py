@@ -0,0 +1,25 @@
+# scheduling.py
+
+from datetime import timedelta
+
+TIME_INTERVALS = ['h4', 'h24', 'd6', 'd12', 'd24', 'd48', 'd96', 'd180']
+TIME_DELTAS = {
+    'h4': timedelta(hours=4),
+    'h24': timedelta(hours=24),
+    'd6': timedelta(days=6),
+    'd12': timedelta(days=12),
+    'd24': timedelta(days=24),
+    'd48': timedelta(days=48),
+    'd96': timedelta(days=96),
+    'd180': timedelta(days=180),
+}
+
+def get_next_status(current_status):
+    if current_status in TIME_INTERVALS:
+        index = TIME_INTERVALS.index(current_status)
+        if index + 1 < len(TIME_INTERVALS):
+            return TIME_INTERVALS[index + 1]
+        else:
+            return TIME_INTERVALS[-1]
+    else:
+        return 'h4'
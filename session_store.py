@@ -0,0 +1,190 @@
+# session_store.py
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+SESSION_TTL = 24 * 60 * 60  # Seconds a session survives without being written
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """
+    Session data kept on the server; the cookie only carries a signed session id.
+    """
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+
+
+class MemorySessionBackend:
+    """
+    In-process session store with LRU eviction and a time-to-live.
+
+    Sessions are not shared between gunicorn workers, so this suits a
+    single-worker deployment or local development.
+    """
+
+    def __init__(self, max_entries=10000, ttl=SESSION_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires < time.time():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            return data
+
+    def set(self, sid, data):
+        with self._lock:
+            self._entries[sid] = (time.time() + self.ttl, data)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+
+class SqliteSessionBackend:
+    """
+    Session store in an SQLite file, shared by every worker on the host.
+    """
+
+    def __init__(self, path='sessions.db', ttl=SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessions '
+                '(sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)')
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._connect().execute(
+            'SELECT data FROM sessions WHERE sid = ? AND expires >= ?', (sid, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, sid, data):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)',
+                (sid, data, now + self.ttl)
+            )
+            # Purge expired sessions every so often rather than on every write
+            self._writes += 1
+            if self._writes % 100 == 0:
+                conn.execute('DELETE FROM sessions WHERE expires < ?', (now,))
+
+    def delete(self, sid):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Flask session interface that stores session data in a backend and
+    sends only a signed session id to the client.
+    """
+    serializer = TaggedJSONSerializer()
+    salt = 'simguistic-session'
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode('utf-8')
+            except BadSignature:
+                sid = None
+            if sid:
+                data = self.backend.get(sid)
+                if data is not None:
+                    return ServerSideSession(self.serializer.loads(data), sid=sid)
+        return ServerSideSession(sid=uuid.uuid4().hex, new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not session.modified and not session.new:
+            return
+
+        self.backend.set(session.sid, self.serializer.dumps(dict(session)))
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode('utf-8'),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+
+def create_session_interface():
+    """
+    Builds the session interface selected by SIMGUISTIC_SESSION_STORE:
+    'memory' (default) or 'sqlite', whose file is SIMGUISTIC_SESSION_DB.
+    """
+    store = os.environ.get('SIMGUISTIC_SESSION_STORE', 'memory')
+    if store == 'memory':
+        backend = MemorySessionBackend()
+    elif store == 'sqlite':
+        backend = SqliteSessionBackend(os.environ.get('SIMGUISTIC_SESSION_DB', 'sessions.db'))
+    else:
+        raise ValueError(f'Unknown session store: {store}')
+    return ServerSideSessionInterface(backend)
@@ -0,0 +1,345 @@
+/* static/cards.js */
+/*
+ * Prefetching card view for the learn and review pages.
+ *
+ * Cards come from the JSON API a batch at a time and are graded in the page,
+ * following the same states as learning.py and review.py. Grades are queued
+ * and posted in the background, so moving to the next card needs no request.
+ */
+(function () {
+    var root = document.getElementById('cards');
+    if (!root) {
+        return;
+    }
+
+    var mode = root.dataset.mode;
+    var nextUrl = root.dataset.nextUrl;
+    var gradesUrl = root.dataset.gradesUrl;
+    var homeUrl = root.dataset.homeUrl;
+    var typoMaxEdits = parseInt(root.dataset.typoEdits, 10) || 0;
+
+    var PREFETCH_BELOW = 3;  // Fetch more review cards when fewer than this are queued
+    var PREFETCH_COUNT = 10;
+    var FLUSH_DELAY = 2000;  // Milliseconds grades may wait before being posted
+    var FLUSH_SIZE = 10;
+    var CORRECT_DELAY = 1000;
+    var LEARN_STREAK = 3;  // Correct answers in a row before a word counts as learned
+    var CHARS_PER_EDIT = 4;  // Expected characters per tolerated typo, as in grading.py
+
+    var queue = [];  // Cards still to show in this round
+    var retry = [];  // Review cards answered wrongly, asked again at the end
+    var learning = [];  // Cards of the current learning round not yet learned
+    var streaks = {};
+    var presented = {};
+    var current = null;
+    var state = null;
+    var exhausted = false;
+    var fetching = null;
+    var started = false;
+
+    var pendingGrades = [];
+    var flushTimer = null;
+
+    var el = function (id) { return document.getElementById(id); };
+
+    // Python's str.split() separators, which differ from \s
+    var WHITESPACE = /[\t-\r\x1c-\x20\x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]+/;
+
+    // Same steps as normalize() in grading.py: decompose, fold case by upper-
+    // then lowercasing, drop marks and ASCII punctuation, collapse whitespace
+    function normalize(text) {
+        return text.normalize('NFKD').toUpperCase().toLowerCase().replace(/\p{M}/gu, '')
+            .replace(/[!-\/:-@\[-`{-~]/g, '').split(WHITESPACE).filter(Boolean).join(' ');
+    }
+
+    // Levenshtein distance, or limit + 1 once it must exceed limit
+    function editDistance(a, b, limit) {
+        if (Math.abs(a.length - b.length) > limit) {
+            return limit + 1;
+        }
+        var previous = [];
+        for (var j = 0; j <= b.length; j++) {
+            previous.push(j);
+        }
+        for (var i = 1; i <= a.length; i++) {
+            var current = [i];
+            var rowMin = i;
+            for (j = 1; j <= b.length; j++) {
+                current.push(Math.min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (a[i - 1] === b[j - 1] ? 0 : 1)
+                ));
+                rowMin = Math.min(rowMin, current[j]);
+            }
+            if (rowMin > limit) {
+                return limit + 1;
+            }
+            previous = current;
+        }
+        return Math.min(previous[b.length], limit + 1);
+    }
+
+    // 'exact', 'close' (within the typo tolerance) or 'wrong', like grade_answer().
+    // A typo on or nearer to one of the card's rival terms is wrong.
+    function gradeAnswer(userInput, card) {
+        var answer = normalize(userInput);
+        var target = normalize(card.answer);
+        if (answer === target) {
+            return 'exact';
+        }
+        var edits = Math.min(typoMaxEdits, Math.floor(target.length / CHARS_PER_EDIT));
+        if (!edits) {
+            return 'wrong';
+        }
+        var distance = editDistance(answer, target, edits);
+        if (distance > edits) {
+            return 'wrong';
+        }
+        var rivals = card.rivals || [];
+        for (var i = 0; i < rivals.length; i++) {
+            if (editDistance(answer, rivals[i], distance - 1) < distance) {
+                return 'wrong';
+            }
+        }
+        return 'close';
+    }
+
+    function shuffle(items) {
+        for (var i = items.length - 1; i > 0; i--) {
+            var j = Math.floor(Math.random() * (i + 1));
+            var tmp = items[i];
+            items[i] = items[j];
+            items[j] = tmp;
+        }
+        return items;
+    }
+
+    function fetchCards() {
+        if (fetching || exhausted) {
+            return fetching || Promise.resolve();
+        }
+        var url = nextUrl;
+        if (mode === 'review') {
+            url += '?count=' + PREFETCH_COUNT + (started ? '' : '&restart=1');
+        }
+        started = true;
+        fetching = fetch(url, {credentials: 'same-origin'})
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error('Could not load cards.');
+                }
+                return response.json();
+            })
+            .then(function (data) {
+                if (!data.cards.length) {
+                    exhausted = true;
+                } else if (mode === 'learn') {
+                    learning = data.cards.slice();
+                    queue = data.cards.slice();
+                } else {
+                    queue = queue.concat(data.cards);
+                }
+            })
+            .catch(function (error) {
+                // Finish with the cards already here rather than retrying in a loop
+                exhausted = true;
+                showError(error.message);
+            })
+            .then(function () {
+                fetching = null;
+            });
+        return fetching;
+    }
+
+    function grade(card, result) {
+        pendingGrades.push({id: card.id, result: result, graded_at: localIsoNow()});
+        if (pendingGrades.length >= FLUSH_SIZE) {
+            flushGrades();
+        } else if (!flushTimer) {
+            flushTimer = setTimeout(flushGrades, FLUSH_DELAY);
+        }
+    }
+
+    function localIsoNow() {
+        // The server stores naive local times, so send one without an offset
+        var now = new Date();
+        return new Date(now.getTime() - now.getTimezoneOffset() * 60000).toISOString().slice(0, 19);
+    }
+
+    function flushGrades(useBeacon) {
+        clearTimeout(flushTimer);
+        flushTimer = null;
+        if (!pendingGrades.length) {
+            return Promise.resolve();
+        }
+        var batch = pendingGrades;
+        pendingGrades = [];
+        var body = JSON.stringify({results: batch});
+        if (useBeacon && navigator.sendBeacon) {
+            navigator.sendBeacon(gradesUrl, new Blob([body], {type: 'application/json'}));
+            return Promise.resolve();
+        }
+        return fetch(gradesUrl, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {'Content-Type': 'application/json'},
+            body: body,
+            keepalive: true
+        }).then(function (response) {
+            if (!response.ok) {
+                throw new Error('Could not save answers.');
+            }
+        }).catch(function (error) {
+            // Keep the grades and try again with the next batch
+            pendingGrades = batch.concat(pendingGrades);
+            showError(error.message);
+        });
+    }
+
+    function showError(text) {
+        el('card-error').textContent = text;
+        el('card-error').hidden = false;
+    }
+
+    function showCard(card, cardState, userInput) {
+        current = card;
+        state = cardState;
+        el('card-loading').hidden = true;
+        el('card').hidden = false;
+        el('card-english').textContent = card.english;
+        el('card-swahili').textContent = card.answer;
+        el('card-swahili-row').hidden = cardState !== 'presentation';
+        el('card-correction').hidden = cardState !== 'correction';
+        el('card-feedback').hidden = cardState !== 'correct';
+        el('card-prompt').textContent = cardState === 'presentation' ? 'English:' : 'Translate into Swahili:';
+
+        var input = el('card-input');
+        input.hidden = cardState === 'presentation';
+        input.readOnly = cardState === 'correct';
+        el('card-submit').disabled = cardState === 'correct';
+        el('card-submit').textContent = cardState === 'presentation' ? 'Continue' : 'Submit';
+        if (cardState === 'correction') {
+            el('card-user-input').textContent = userInput;
+            el('card-answer').textContent = card.answer;
+            input.placeholder = 'Enter the correct translation';
+        } else {
+            input.placeholder = 'Enter Swahili translation';
+        }
+        if (cardState === 'correct') {
+            input.value = userInput;
+        } else {
+            input.value = '';
+            input.focus();
+        }
+    }
+
+    function finish(message) {
+        flushGrades();
+        el('card').hidden = true;
+        el('card-loading').hidden = true;
+        el('card-message').textContent = message;
+        el('card-message').hidden = false;
+        setTimeout(function () {
+            flushGrades().then(function () {
+                window.location.href = homeUrl;
+            });
+        }, 2000);
+    }
+
+    function nextCard() {
+        if (mode === 'review' && queue.length < PREFETCH_BELOW) {
+            fetchCards();
+        }
+        if (!queue.length) {
+            if (mode === 'learn' && learning.length) {
+                queue = shuffle(learning.slice());
+            } else if (mode === 'review' && !exhausted) {
+                el('card-loading').hidden = false;
+                fetchCards().then(nextCard);
+                return;
+            } else if (mode === 'review' && retry.length) {
+                queue = shuffle(retry);
+                retry = [];
+            } else {
+                finish(mode === 'learn' ? 'All words have been learned!' : 'Review session completed!');
+                return;
+            }
+        }
+
+        var card = queue.shift();
+        if (mode === 'learn' && !presented[card.id]) {
+            presented[card.id] = true;
+            showCard(card, 'presentation');
+        } else {
+            showCard(card, 'testing');
+        }
+    }
+
+    function showCorrect(message, userInput) {
+        showCard(current, 'correct', userInput);
+        el('card-feedback').firstElementChild.textContent = message;
+        setTimeout(nextCard, CORRECT_DELAY);
+    }
+
+    function submit(userInput) {
+        var answerGrade = gradeAnswer(userInput, current);
+        var isCorrect = answerGrade !== 'wrong';
+        var spelling = answerGrade === 'close' ? ' (Spelling: ' + current.answer + ')' : '';
+
+        if (state === 'presentation') {
+            showCard(current, 'testing');
+        } else if (state === 'testing' && mode === 'review') {
+            grade(current, isCorrect ? 'correct' : 'incorrect');
+            if (isCorrect) {
+                showCorrect('Correct!' + spelling, userInput);
+            } else {
+                retry.push(current);
+                showCard(current, 'correction', userInput);
+            }
+        } else if (state === 'testing') {
+            if (isCorrect) {
+                streaks[current.id] = (streaks[current.id] || 0) + 1;
+                if (streaks[current.id] >= LEARN_STREAK) {
+                    grade(current, 'learned');
+                    learning = learning.filter(function (card) { return card.id !== current.id; });
+                    showCorrect('New word learned!' + spelling, userInput);
+                } else {
+                    showCorrect('Correct!' + spelling, userInput);
+                }
+            } else {
+                streaks[current.id] = 0;
+                showCard(current, 'correction', userInput);
+            }
+        } else if (state === 'correction') {
+            if (isCorrect) {
+                if (mode === 'learn') {
+                    showCard(current, 'testing');
+                } else {
+                    showCorrect('Correct!', userInput);
+                }
+            } else {
+                showCard(current, 'correction', userInput);
+            }
+        }
+    }
+
+    el('card-form').addEventListener('submit', function (event) {
+        event.preventDefault();
+        if (current && state !== 'correct') {
+            submit(el('card-input').value);
+        }
+    });
+
+    window.addEventListener('pagehide', function () {
+        flushGrades(true);
+    });
+
+    fetchCards().then(function () {
+        if (!queue.length) {
+            finish(mode === 'learn' ? 'All words have been learned!' : 'No words are due for review!');
+        } else {
+            nextCard();
+        }
+    });
+})();
@@ -0,0 +1,590 @@
+# storage.py
+
+import csv
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+
+from deck import Deck, due_to_epoch
+from journal import COMPACT_BYTES, get_journal, snapshot_id
+from locking import GroupCommit, user_lock
+import metrics
+
+USERS_DIR = 'users'
+# Files derived from the wordlists, such as snapshots and summaries. They are
+# kept out of USERS_DIR, whose mtime the user registry watches for new users.
+CACHE_DIR = os.path.join(USERS_DIR, 'cache')
+DECKS_DIR = os.environ.get('SIMGUISTIC_DECKS_DIR', 'decks')  # Base decks new users can start from
+FIELDNAMES = ['english', 'swahili', 'status', 'due']
+
+
+def read_csv_rows(csvfile):
+    """
+    Yields word dicts from an open CSV file, numbering them by row position.
+    """
+    reader = csv.DictReader(csvfile)
+    for word_id, row in enumerate(reader):
+        yield {
+            'id': word_id,
+            'english': row['english'],
+            'swahili': row['swahili'],
+            'status': row.get('status') or '',
+            'due': row.get('due') or ''
+        }
+
+
+def write_csv_rows(csvfile, wordlist):
+    """
+    Writes word dicts to an open file in the wordlist CSV format.
+    """
+    writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES, extrasaction='ignore')
+    writer.writeheader()
+    for word in wordlist:
+        writer.writerow(word)
+
+
+def _read_snapshot(snap_path, source_id):
+    # The Deck in a snapshot of the given source file, or None if there is none
+    try:
+        with open(snap_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return Deck.read_snapshot(data, source_id)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def _write_snapshot(snap_path, source_id, deck):
+    # Not fsynced: a lost or torn snapshot fails its checks and is rebuilt
+    tmp_path = f'{snap_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(snap_path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            deck.write_snapshot(f, source_id)
+        os.replace(tmp_path, snap_path)
+    except (OSError, ValueError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_csv_deck(csv_path, snap_path):
+    """
+    Reads a wordlist CSV as a Deck through a binary snapshot of it, which is
+    written to snap_path on first use and again once the CSV has changed.
+    Returns the deck and the number of bytes read. Callers keep the CSV
+    from being replaced meanwhile.
+    """
+    source_id = snapshot_id(csv_path)
+    deck = _read_snapshot(snap_path, source_id)
+    if deck is not None:
+        return deck, os.path.getsize(snap_path)
+    with open(csv_path, 'r', newline='', encoding='utf-8') as csvfile:
+        deck = Deck.from_wordlist(read_csv_rows(csvfile))
+        size = os.fstat(csvfile.fileno()).st_size
+    if snapshot_id(csv_path) == source_id:
+        _write_snapshot(snap_path, source_id, deck)
+    return deck, size
+
+
+def _text_bytes(words, fields=FIELDNAMES):
+    """
+    Approximate size of the given fields of some words, for byte counts
+    where the backend does not deal in files.
+    """
+    return sum(len(word[field].encode('utf-8')) for word in words for field in fields)
+
+
+class BaseStorage:
+    """
+    Shared write path of the storage backends.
+
+    Writers hold the per-user lock, and return the storage signature from
+    before and after their write so a cache can tell whether anyone else
+    wrote in between. When SIMGUISTIC_GROUP_COMMIT is set, concurrent
+    updates for one user are coalesced into a single write.
+    """
+
+    def __init__(self):
+        self._group_commit = None
+        if os.environ.get('SIMGUISTIC_GROUP_COMMIT'):
+            self._group_commit = GroupCommit(self._commit)
+
+    def update_words(self, username, words):
+        """
+        Persists status/due changes; returns the (before, after) signatures.
+        """
+        if self._group_commit is not None:
+            return self._group_commit.submit(username, words)
+        return self._commit(username, words)
+
+    def _commit(self, username, words):
+        with user_lock(username):
+            before = self.signature(username)
+            self._write_words(username, words)
+            return before, self.signature(username)
+
+    def save(self, username, wordlist):
+        """
+        Replaces the whole wordlist; returns the new signature.
+        """
+        with user_lock(username):
+            self._write_all(username, wordlist)
+            return self.signature(username)
+
+    def append_words(self, username, words):
+        """
+        Adds new words after the existing ones, creating the wordlist if
+        needed; returns the new signature.
+        """
+        with user_lock(username):
+            self._append(username, words)
+            return self.signature(username)
+
+    def load_deck(self, username):
+        return Deck.from_wordlist(self.load(username))
+
+
+class CsvStorage(BaseStorage):
+    """
+    Stores each user's wordlist as 'users/{username}_wordlist.csv'.
+
+    Graded answers are appended to 'users/{username}_wordlist.journal'
+    instead of rewriting the CSV; loading replays the journal over the CSV,
+    and the journal is folded back into the CSV once it grows past
+    COMPACT_BYTES. Decks are loaded from 'users/cache/{username}_wordlist.snap',
+    a pre-parsed snapshot of the CSV, while the CSV is unchanged.
+    """
+    name = 'csv'
+    suffix = '_wordlist.csv'
+
+    def path(self, username):
+        return os.path.join(USERS_DIR, f'{username}{self.suffix}')
+
+    def snapshot_path(self, username):
+        return os.path.join(CACHE_DIR, f'{username}_wordlist.snap')
+
+    def journal(self, username):
+        return get_journal(os.path.join(USERS_DIR, f'{username}_wordlist.journal'), self.path(username))
+
+    def exists(self, username):
+        return os.path.exists(self.path(username))
+
+    def signature(self, username):
+        """
+        Changes whenever the CSV or its journal is written, by any process.
+        """
+        return (snapshot_id(self.path(username)), snapshot_id(self.journal(username).path))
+
+    def load(self, username):
+        filepath = self.path(username)
+        # A shared lock keeps a compaction from swapping the CSV mid-read
+        with user_lock(username, shared=True):
+            if not os.path.exists(filepath):
+                return []
+            with open(filepath, 'r', newline='', encoding='utf-8') as csvfile:
+                wordlist = list(read_csv_rows(csvfile))
+                size = os.fstat(csvfile.fileno()).st_size
+            journal = self.journal(username)
+            metrics.add_bytes(username, 'read', size + journal.size())
+            return journal.replay(wordlist)
+
+    def load_deck(self, username):
+        filepath = self.path(username)
+        with user_lock(username, shared=True):
+            if not os.path.exists(filepath):
+                return Deck()
+            deck, size = load_csv_deck(filepath, self.snapshot_path(username))
+            journal = self.journal(username)
+            metrics.add_bytes(username, 'read', size + journal.size())
+            for entry in journal.entries():
+                word_id = entry['id']
+                if 0 <= word_id < len(deck) and deck.swahili[word_id] == entry['swahili']:
+                    deck.update(word_id, entry['status'], entry['due'])
+        return deck
+
+    def _write_all(self, username, wordlist):
+        filepath = self.path(username)
+        # Write to a temp file and rename it over the CSV, so readers and
+        # crashes only ever see the old or the new deck, never a partial one
+        tmp_path = f'{filepath}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as csvfile:
+                write_csv_rows(csvfile, wordlist)
+                csvfile.flush()
+                os.fsync(csvfile.fileno())
+            metrics.add_bytes(username, 'write', os.path.getsize(tmp_path))
+            os.replace(tmp_path, filepath)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        # The new snapshot already holds every journalled change
+        self.journal(username).reset()
+
+    def _write_words(self, username, words):
+        if not self.exists(username):
+            return
+        journal = self.journal(username)
+        size = journal.size()
+        # A group commit is one batch shared by several requests; make it durable at once
+        journal.append(words, sync=self._group_commit is not None)
+        metrics.add_bytes(username, 'write', journal.size() - size)
+        if journal.size() > COMPACT_BYTES:
+            self.compact(username)
+
+    def compact(self, username):
+        """
+        Folds the journal into a fresh CSV snapshot.
+        """
+        with user_lock(username):
+            self._write_all(username, self.load(username))
+
+    def _append(self, username, words):
+        filepath = self.path(username)
+        journal = self.journal(username)
+        # Appending changes the snapshot and so orphans the journal; fold it in first
+        if next(journal.entries(), None) is not None:
+            self.compact(username)
+        is_new = not os.path.exists(filepath)
+        newline_needed = False
+        if not is_new:
+            with open(filepath, 'rb') as f:
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    newline_needed = f.read(1) != b'\n'
+        with open(filepath, 'a', newline='', encoding='utf-8') as csvfile:
+            start = csvfile.tell()
+            if newline_needed:
+                # Keep a last row without a line ending from swallowing the first new one
+                csvfile.write('\r\n')
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES, extrasaction='ignore')
+            if is_new:
+                writer.writeheader()
+            writer.writerows(words)
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+            metrics.add_bytes(username, 'write', csvfile.tell() - start)
+        journal.reset()
+
+
+class SqliteStorage(BaseStorage):
+    """
+    Stores each user's wordlist in 'users/{username}_wordlist.db'.
+
+    Words keep their CSV row position as the primary key, so grading a single
+    answer is one indexed UPDATE rather than a rewrite of the whole deck.
+    Swahili terms are indexed but not unique, since decks contain duplicates.
+    """
+    name = 'sqlite'
+    suffix = '_wordlist.db'
+    schema_version = 1  # PRAGMA user_version once the schema exists and is seeded
+
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+
+    def path(self, username):
+        return os.path.join(USERS_DIR, f'{username}{self.suffix}')
+
+    def exists(self, username):
+        return os.path.exists(self.path(username)) or CsvStorage().exists(username)
+
+    def signature(self, username):
+        """
+        Changes whenever the database or its write-ahead log is written.
+        """
+        filepath = self.path(username)
+        return (snapshot_id(filepath), snapshot_id(filepath + '-wal'), snapshot_id(CsvStorage().path(username)))
+
+    def _connect(self, username):
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get(username)
+        if conn is not None:
+            return conn
+
+        conn = sqlite3.connect(self.path(username), timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        if conn.execute('PRAGMA user_version').fetchone()[0] < self.schema_version:
+            self._initialize(conn, username)
+        connections[username] = conn
+        return conn
+
+    def _initialize(self, conn, username):
+        # Creates the schema and seeds it from the user's CSV, if there is
+        # one, in a single write transaction, so other workers opening the
+        # database at the same time wait for it instead of seeing it empty
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('PRAGMA user_version').fetchone()[0] < self.schema_version:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS words ('
+                    'id INTEGER PRIMARY KEY, english TEXT NOT NULL, swahili TEXT NOT NULL, '
+                    "status TEXT NOT NULL DEFAULT '', due TEXT NOT NULL DEFAULT '', due_ts INTEGER)"
+                )
+                conn.execute('CREATE INDEX IF NOT EXISTS words_swahili ON words (swahili)')
+                conn.execute('CREATE INDEX IF NOT EXISTS words_due ON words (due_ts)')
+                # Databases from before user_version was set are already seeded
+                if not conn.execute('SELECT COUNT(*) FROM words').fetchone()[0]:
+                    self._insert(conn, CsvStorage().load(username), 0)
+                conn.execute(f'PRAGMA user_version = {self.schema_version}')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _insert(self, conn, wordlist, start):
+        conn.executemany(
+            'INSERT INTO words (id, english, swahili, status, due, due_ts) VALUES (?, ?, ?, ?, ?, ?)',
+            [
+                (word_id, word['english'], word['swahili'], word['status'], word['due'],
+                 due_to_epoch(word['due']) if word['due'] else None)
+                for word_id, word in enumerate(wordlist, start)
+            ]
+        )
+
+    def load(self, username):
+        if not self.exists(username):
+            return []
+        conn = self._connect(username)
+        rows = conn.execute('SELECT id, english, swahili, status, due FROM words ORDER BY id')
+        wordlist = [
+            {'id': word_id, 'english': english, 'swahili': swahili, 'status': status, 'due': due}
+            for word_id, english, swahili, status, due in rows
+        ]
+        if metrics.ENABLED:
+            metrics.add_bytes(username, 'read', _text_bytes(wordlist))
+        return wordlist
+
+    def _write_all(self, username, wordlist):
+        conn = self._connect(username)
+        with conn:
+            conn.execute('DELETE FROM words')
+            self._insert(conn, wordlist, 0)
+        if metrics.ENABLED:
+            metrics.add_bytes(username, 'write', _text_bytes(wordlist))
+
+    def _append(self, username, words):
+        conn = self._connect(username)
+        with conn:
+            start = conn.execute('SELECT COALESCE(MAX(id) + 1, 0) FROM words').fetchone()[0]
+            self._insert(conn, words, start)
+        if metrics.ENABLED:
+            metrics.add_bytes(username, 'write', _text_bytes(words))
+
+    def _write_words(self, username, words):
+        conn = self._connect(username)
+        with conn:
+            conn.executemany(
+                'UPDATE words SET status = ?, due = ?, due_ts = ? WHERE id = ?',
+                [
+                    (word['status'], word['due'], due_to_epoch(word['due']) if word['due'] else None, word['id'])
+                    for word in words
+                ]
+            )
+        if metrics.ENABLED:
+            metrics.add_bytes(username, 'write', _text_bytes(words, ('status', 'due')))
+
+
+_base_decks = {}
+_base_decks_lock = threading.Lock()
+_deck_names = (None, None, [])  # DECKS_DIR, its mtime and the deck names listed then
+_deck_names_lock = threading.Lock()
+
+
+def list_base_decks():
+    """
+    Names of the base decks, the CSV wordlists in DECKS_DIR. The directory
+    is only listed again when its mtime changes; there are none if it is missing.
+    """
+    global _deck_names
+    with _deck_names_lock:
+        try:
+            mtime = os.stat(DECKS_DIR).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if _deck_names[:2] != (DECKS_DIR, mtime):
+            names = sorted(
+                filename[:-len('.csv')] for filename in os.listdir(DECKS_DIR) if filename.endswith('.csv')
+            )
+            _deck_names = (DECKS_DIR, mtime, names)
+        return list(_deck_names[2])
+
+
+def get_base_deck(name):
+    """
+    Returns a base deck, parsed once per process and shared by its users.
+    Any statuses and due dates in the deck's CSV are dropped, so a user's
+    progress comes from their overlay alone.
+    """
+    with _base_decks_lock:
+        deck = _base_decks.get(name)
+        if deck is None:
+            if name not in list_base_decks():
+                raise ValueError(f'Unknown deck: {name}')
+            deck = load_csv_deck(
+                os.path.join(DECKS_DIR, f'{name}.csv'), os.path.join(CACHE_DIR, f'{name}.deck.snap')
+            )[0]
+            deck.clear_progress()
+            _base_decks[name] = deck
+        return deck
+
+
+class OverlayStorage(BaseStorage):
+    """
+    Stores a user's progress as a sparse overlay on a shared base deck.
+
+    'users/{username}_progress.json' names the base deck and holds the
+    status and due date of only those words that have one. Grading appends
+    to 'users/{username}_progress.journal', compacted like the CSV journal.
+    Base decks are parsed once per process and every user's Deck shares
+    their term lists, so each user costs the status and due columns in
+    memory and the studied words on disk. Base decks are treated as
+    read-only.
+
+    Users without a progress file are handed to the fallback backend.
+    """
+    name = 'overlay'
+    suffix = '_progress.json'
+
+    def __init__(self, fallback):
+        super().__init__()
+        self.fallback = fallback
+
+    def path(self, username):
+        return os.path.join(USERS_DIR, f'{username}{self.suffix}')
+
+    def journal(self, username):
+        return get_journal(os.path.join(USERS_DIR, f'{username}_progress.journal'), self.path(username))
+
+    def is_overlay(self, username):
+        return os.path.exists(self.path(username))
+
+    def exists(self, username):
+        return self.is_overlay(username) or self.fallback.exists(username)
+
+    def signature(self, username):
+        if not self.is_overlay(username):
+            return self.fallback.signature(username)
+        return (snapshot_id(self.path(username)), snapshot_id(self.journal(username).path))
+
+    def create(self, username, deck_name):
+        """
+        Creates a user with no progress yet on the named base deck.
+        """
+        get_base_deck(deck_name)
+        with user_lock(username):
+            if self.exists(username):
+                raise ValueError(f'User already exists: {username}')
+            self._write_progress(username, deck_name, [])
+
+    def _read_progress(self, username):
+        with open(self.path(username), 'r', encoding='utf-8') as f:
+            progress = json.load(f)
+            metrics.add_bytes(username, 'read', f.tell())
+        return progress['deck'], progress['words']
+
+    def _write_progress(self, username, deck_name, words):
+        filepath = self.path(username)
+        tmp_path = f'{filepath}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'deck': deck_name, 'words': words}, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            metrics.add_bytes(username, 'write', os.path.getsize(tmp_path))
+            os.replace(tmp_path, filepath)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load(self, username):
+        if not self.is_overlay(username):
+            return self.fallback.load(username)
+        return self.load_deck(username).to_wordlist()
+
+    def load_deck(self, username):
+        if not self.is_overlay(username):
+            return self.fallback.load_deck(username)
+        with user_lock(username, shared=True):
+            deck_name, words = self._read_progress(username)
+            deck = get_base_deck(deck_name).fork()
+            for word_id, status, due in words:
+                if 0 <= word_id < len(deck):
+                    deck.assign(word_id, status, due)
+            journal = self.journal(username)
+            metrics.add_bytes(username, 'read', journal.size())
+            for entry in journal.entries():
+                word_id = entry['id']
+                if 0 <= word_id < len(deck) and deck.swahili[word_id] == entry['swahili']:
+                    deck.assign(word_id, entry['status'], entry['due'])
+        deck.build_due_index()
+        return deck
+
+    def update_words(self, username, words):
+        if not self.is_overlay(username):
+            return self.fallback.update_words(username, words)
+        return super().update_words(username, words)
+
+    def save(self, username, wordlist):
+        if not self.is_overlay(username):
+            return self.fallback.save(username, wordlist)
+        return super().save(username, wordlist)
+
+    def append_words(self, username, words):
+        if not self.is_overlay(username):
+            return self.fallback.append_words(username, words)
+        raise ValueError(f'{username} can only keep progress on the words of their base deck')
+
+    def _write_all(self, username, wordlist):
+        deck_name, _ = self._read_progress(username)
+        base = get_base_deck(deck_name)
+        words = []
+        for word_id, word in enumerate(wordlist):
+            if word_id >= len(base) or (word['english'], word['swahili']) != (base.english[word_id], base.swahili[word_id]):
+                raise ValueError(f'{username} can only keep progress on the words of the {deck_name} deck')
+            if word['status'] or word['due']:
+                words.append([word_id, word['status'], word['due']])
+        self._write_progress(username, deck_name, words)
+        self.journal(username).reset()
+
+    def _write_words(self, username, words):
+        journal = self.journal(username)
+        size = journal.size()
+        journal.append(words, sync=self._group_commit is not None)
+        metrics.add_bytes(username, 'write', journal.size() - size)
+        if journal.size() > COMPACT_BYTES:
+            self.compact(username)
+
+    def compact(self, username):
+        """
+        Folds the journal into a fresh progress file.
+        """
+        with user_lock(username):
+            self._write_all(username, self.load(username))
+
+
+STORAGE_BACKENDS = {
+    'csv': CsvStorage,
+    'sqlite': SqliteStorage,
+}
+
+_storage = None
+
+
+def get_storage():
+    """
+    Returns the storage for all users. Users created on a base deck use
+    OverlayStorage; the rest use the backend selected by the
+    SIMGUISTIC_STORAGE environment variable ('csv' by default, or 'sqlite').
+    """
+    global _storage
+    if _storage is None:
+        backend = os.environ.get('SIMGUISTIC_STORAGE', 'csv')
+        if backend not in STORAGE_BACKENDS:
+            raise ValueError(f'Unknown storage backend: {backend}')
+        _storage = OverlayStorage(STORAGE_BACKENDS[backend]())
+    return _storage
@@ -0,0 +1,184 @@
+# summary.py
+
+import json
+import os
+import threading
+
+from deck import NEW, NO_DUE, OTHER, STATUS_CODES, due_to_epoch
+from storage import CACHE_DIR
+
+BUCKET_SECONDS = 3600  # Width of a due-time histogram bucket
+FORMAT = 2  # Version of the summary files; files in another format are rebuilt
+
+
+def _bucket(due_ts):
+    return due_ts // BUCKET_SECONDS
+
+
+def _normalize(signature):
+    # Signatures are compared with what was read back from JSON
+    return json.loads(json.dumps(signature))
+
+
+class Summary:
+    """
+    Per-user counts for the home page, kept current without the deck.
+
+    Holds the number of learned and not-learned words and an hourly
+    histogram of the due times of learned words. Words due in past hours
+    are counted from the histogram; those due in the current hour, if there
+    are any, from the deck's due index, so due counts are exact. The summary
+    remembers the storage signature it describes, and is rebuilt from the
+    deck when that no longer matches.
+    """
+
+    def __init__(self, signature, learned=0, not_learned=0, buckets=None):
+        self.signature = _normalize(signature)
+        self.learned = learned
+        self.not_learned = not_learned
+        self.buckets = buckets if buckets is not None else {}  # bucket -> learned words due in it
+
+    @classmethod
+    def from_deck(cls, signature, deck):
+        summary = cls(signature)
+        for code, due_ts in zip(deck.status, deck.due):
+            summary._add(code, due_ts, 1)
+        return summary
+
+    def _add(self, code, due_ts, count):
+        if code != NEW:
+            self.learned += count
+            if due_ts != NO_DUE:
+                bucket = _bucket(due_ts)
+                remaining = self.buckets.get(bucket, 0) + count
+                if remaining:
+                    self.buckets[bucket] = remaining
+                else:
+                    del self.buckets[bucket]
+        elif due_ts == NO_DUE:
+            self.not_learned += count
+
+    def apply(self, changes, signature):
+        """
+        Moves words between counts; 'changes' holds (old code, old due, new code, new due).
+        """
+        for old_code, old_due, new_code, new_due in changes:
+            self._add(old_code, old_due, -1)
+            self._add(new_code, new_due, 1)
+        self.signature = _normalize(signature)
+
+    def count_due(self, now_ts, load_deck):
+        """
+        Number of learned words whose due date has passed. 'load_deck' is
+        called for the deck this summary describes only when words are due
+        in the current hour.
+        """
+        current = _bucket(now_ts)
+        due = sum(count for bucket, count in self.buckets.items() if bucket < current)
+        if self.buckets.get(current):
+            deck = load_deck()
+            due += deck.count_due(now_ts) - deck.count_due(current * BUCKET_SECONDS - 1)
+        return due
+
+    def to_json(self):
+        return {
+            'format': FORMAT,
+            'signature': self.signature,
+            'learned': self.learned,
+            'not_learned': self.not_learned,
+            'buckets': sorted(self.buckets.items())
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        if data.get('format') != FORMAT:
+            raise ValueError('Summary in an old format')
+        return cls(data['signature'], data['learned'], data['not_learned'],
+                   {bucket: count for bucket, count in data['buckets']})
+
+
+class SummaryStore:
+    """
+    Keeps each user's Summary in memory and in 'users/cache/{username}_summary.json',
+    so the home page needs neither the deck nor a parse of the wordlist.
+    The file is only a cache: a missing, unreadable or out-of-date one is
+    rebuilt from the deck.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._summaries = {}
+        self._lock = threading.Lock()
+
+    def path(self, username):
+        return os.path.join(self.cache_dir, f'{username}_summary.json')
+
+    def get(self, username, signature):
+        """
+        Returns the user's summary if it describes 'signature', otherwise None.
+        """
+        signature = _normalize(signature)
+        with self._lock:
+            summary = self._summaries.get(username)
+        if summary is not None and summary.signature == signature:
+            return summary
+        try:
+            with open(self.path(username), encoding='utf-8') as f:
+                summary = Summary.from_json(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if summary.signature != signature:
+            return None
+        with self._lock:
+            self._summaries[username] = summary
+        return summary
+
+    def put(self, username, summary, persist=True):
+        with self._lock:
+            self._summaries[username] = summary
+            data = summary.to_json() if persist else None
+        if persist:
+            self._write(username, data)
+
+    def update(self, username, before, after, changes, persist=True):
+        """
+        Applies status changes written between the 'before' and 'after'
+        signatures. Returns False if the summary was not at 'before', in
+        which case the caller should rebuild it. With persist=False only the
+        in-memory summary changes, for updates that are yet to be written.
+        """
+        before = _normalize(before)
+        with self._lock:
+            summary = self._summaries.get(username)
+            if summary is None or summary.signature != before:
+                return False
+            summary.apply(changes, after)
+            data = summary.to_json() if persist else None
+        if persist:
+            self._write(username, data)
+        return True
+
+    def _write(self, username, data):
+        # Not fsynced: a lost or stale summary is simply rebuilt
+        filepath = self.path(username)
+        tmp_path = f'{filepath}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, filepath)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def status_change(deck, word):
+    """
+    Returns the (old code, old due, new code, new due) of a word about to be
+    written, taking the old values from the deck.
+    """
+    word_id = word['id']
+    return (
+        deck.status[word_id], deck.due[word_id],
+        STATUS_CODES.get(word['status'], OTHER), due_to_epoch(word['due'])
+    )
@@ -0,0 +1,45 @@
+# tests/conftest.py
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+BASE_ROWS = [
+    ('to eat', 'kula', 'h4', '2024-10-13T13:23:52'),
+    ('to be', 'kuwa', 'h24', '2024-10-14T09:00:00'),
+    ('to come', 'kuja', '', ''),
+    ('to say', 'kusema', '', ''),
+]
+
+
+def write_wordlist(username, size, status='', due=''):
+    with open(os.path.join('users', f'{username}_wordlist.csv'), 'w', newline='', encoding='utf-8') as f:
+        storage.write_csv_rows(f, [
+            {'english': f'english {n}', 'swahili': f'swahili {n}', 'status': status, 'due': due}
+            for n in range(size)
+        ])
+
+
+@pytest.fixture
+def app_dir(tmp_path, monkeypatch):
+    """
+    An empty app directory holding a 'users' directory and a base deck
+    'basic', whose CSV has progress of its own as wordlist_500.csv does.
+    """
+    decks_dir = tmp_path / 'decks'
+    decks_dir.mkdir()
+    (tmp_path / 'users').mkdir()
+    with open(decks_dir / 'basic.csv', 'w', newline='', encoding='utf-8') as f:
+        storage.write_csv_rows(f, [
+            {'english': english, 'swahili': swahili, 'status': status, 'due': due}
+            for english, swahili, status, due in BASE_ROWS
+        ])
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(storage, 'DECKS_DIR', str(decks_dir))
+    monkeypatch.setattr(storage, '_base_decks', {})
+    return tmp_path
@@ -0,0 +1,112 @@
+# tests/test_grading.py
+
+import json
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+
+import grading
+from deck import Deck
+from grading import CLOSE, EXACT, WRONG, find_other_card, grade_answer, rival_terms
+
+WORDS = [('to eat', 'kula'), ('to be', 'kuwa'), ('to come', 'kuja'), ('to say', 'kusema')]
+
+
+def make_deck():
+    return Deck.from_wordlist([
+        {'english': english, 'swahili': swahili, 'status': '', 'due': ''} for english, swahili in WORDS
+    ])
+
+
+def test_typo_tolerance_rejects_other_cards_terms(monkeypatch):
+    monkeypatch.setattr(grading, 'TYPO_MAX_EDITS', 1)
+    deck = make_deck()
+    # One edit from 'kula', but exactly 'to be' and 'to come'
+    assert grade_answer('kuwa', 'kula') == CLOSE
+    assert grade_answer('kuwa', 'kula', deck) == WRONG
+    assert grade_answer('kuja', 'kula', deck) == WRONG
+    assert find_other_card(deck, 'kuwa', 0) == 1
+    assert find_other_card(deck, 'kuja', 0) == 2
+
+
+def test_typo_tolerance_rejects_answers_nearer_other_terms(monkeypatch):
+    monkeypatch.setattr(grading, 'TYPO_MAX_EDITS', 2)
+    deck = Deck.from_wordlist([
+        {'english': 'to write', 'swahili': 'kuandika', 'status': '', 'due': ''},
+        {'english': 'to leave', 'swahili': 'kuondoka', 'status': '', 'due': ''},
+    ])
+    # Two edits from 'kuandika', one from 'kuondoka'
+    assert grade_answer('kuendoka', 'kuandika') == CLOSE
+    assert grade_answer('kuendoka', 'kuandika', deck) == WRONG
+    assert find_other_card(deck, 'kuendoka', 0) == 1
+    # As many edits from each is still a typo
+    assert grade_answer('kuandoka', 'kuandika', deck) == CLOSE
+
+
+def test_typo_tolerance_keeps_plain_typos(monkeypatch):
+    monkeypatch.setattr(grading, 'TYPO_MAX_EDITS', 1)
+    deck = make_deck()
+    assert grade_answer('Kula!', 'kula', deck) == EXACT
+    assert grade_answer('kulla', 'kula', deck) == CLOSE
+    assert grade_answer('kusena', 'kusema', deck) == CLOSE
+    assert grade_answer('kutaka', 'kula', deck) == WRONG
+    assert sorted(rival_terms(deck, 'kula')) == ['kuja', 'kuwa']
+
+
+def test_grading_ignores_the_deck_without_typo_tolerance(monkeypatch):
+    monkeypatch.setattr(grading, 'TYPO_MAX_EDITS', 0)
+    deck = make_deck()
+    assert grade_answer('kuwa', 'kula', deck) == WRONG
+    assert grade_answer('KULA', 'kula', deck) == EXACT
+    assert rival_terms(deck, 'kula') == []
+
+
+CARDS_JS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'simguistic', 'static', 'cards.js')
+PARITY_INPUTS = [
+    'Kula', '  Kula,  sana! ', 'Straße', 'STRASSE', 'ẞ', 'ΟΔΟΣ', 'οδοσ', 'ς', 'café', 'café',
+    'x᷀y', 'e⃝', 'kaः', 'ﬁ', 'İstanbul', 'ǰ', 'Ǆ', 'ℌ', 'ŉ', 'ﾃｽﾄ', 'a b　c',
+    'a\x1cb\x85c', 'a﻿b', 'naïve—résumé', '',
+]
+
+
+def run_cards_js(script):
+    # Runs a script after the grading functions and settings of cards.js
+    with open(CARDS_JS, encoding='utf-8') as f:
+        source = f.read()
+    parts = [f'var typoMaxEdits = {grading.TYPO_MAX_EDITS};']
+    parts += re.findall(r'^    var (?:CHARS_PER_EDIT|WHITESPACE) = .*$', source, re.M)
+    for name in ('normalize', 'editDistance', 'gradeAnswer'):
+        parts.append(re.search(r'^    function %s\(.*?^    }$' % name, source, re.M | re.S).group(0))
+    result = subprocess.run(
+        ['node', '-e', '\n'.join(parts + [script])], capture_output=True, check=True, encoding='utf-8'
+    )
+    return json.loads(result.stdout)
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='needs node')
+def test_browser_normalizes_like_the_server():
+    results = run_cards_js(
+        f'console.log(JSON.stringify({json.dumps(PARITY_INPUTS)}.map(normalize)))'
+    )
+    assert results == [grading.normalize(text) for text in PARITY_INPUTS]
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='needs node')
+def test_browser_grades_like_the_server(monkeypatch):
+    monkeypatch.setattr(grading, 'TYPO_MAX_EDITS', 2)
+    deck = Deck.from_wordlist([
+        {'english': english, 'swahili': swahili, 'status': '', 'due': ''}
+        for english, swahili in WORDS + [('to write', 'kuandika'), ('to leave', 'kuondoka')]
+    ])
+    cases = [
+        (answer, {'answer': expected, 'rivals': rival_terms(deck, expected)})
+        for expected in ('kula', 'kusema', 'kuandika')
+        for answer in ('kula', 'kuwa', 'KUJA', 'kulla', 'kusena', 'Kusema!', 'kuendoka', 'kuandoka', 'kuandka')
+    ]
+    results = run_cards_js(
+        f'console.log(JSON.stringify({json.dumps(cases)}.map(function (c) {{ return gradeAnswer(c[0], c[1]); }})))'
+    )
+    assert results == [grade_answer(answer, card['answer'], deck) for answer, card in cases]
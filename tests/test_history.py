@@ -0,0 +1,36 @@
+# tests/test_history.py
+
+import os
+from datetime import datetime, timedelta
+
+import history
+import wordlist_utils
+from conftest import write_wordlist
+
+
+def test_forecast_covers_words_graded_before_the_history(app_dir):
+    tomorrow = (datetime.now() + timedelta(days=1)).isoformat()
+    write_wordlist('forecaster', 10, status='d6', due=tomorrow)
+    assert not os.path.exists(history.history_path('forecaster'))
+
+    forecast = history.due_forecast('forecaster')
+    assert [day['due'] for day in forecast[:3]] == [0, 10, 0]
+
+    word = wordlist_utils.load_wordlist('forecaster')[0]
+    word.update(status='d18', due=(datetime.now() + timedelta(days=2)).isoformat())
+    wordlist_utils.update_word('forecaster', word)
+    history.record('forecaster', word, 'd6', history.EXACT, history.REVIEW)
+
+    forecast = history.due_forecast('forecaster')
+    assert [day['due'] for day in forecast[:3]] == [0, 9, 1]
+    assert history.retention('forecaster')[history.STATUS_CODES['d6'] - 1]['attempts'] == 1
+
+
+def test_baseline_is_written_once(app_dir):
+    write_wordlist('baseline', 5, status='h4', due=datetime.now().isoformat())
+    history.baseline('baseline')
+    size = os.path.getsize(history.history_path('baseline'))
+    assert size == 5 * history.RECORD.size
+    history.baseline('baseline')
+    history.record('baseline', wordlist_utils.load_wordlist('baseline')[0], 'h4', history.WRONG, history.REVIEW)
+    assert os.path.getsize(history.history_path('baseline')) == size + history.RECORD.size
@@ -0,0 +1,87 @@
+# tests/test_journal.py
+
+import os
+
+import journal
+import storage
+from conftest import write_wordlist
+from storage import CsvStorage
+
+
+def graded(store, username, word_ids, status='h4'):
+    wordlist = store.load(username)
+    words = []
+    for word_id in word_ids:
+        word = wordlist[word_id]
+        word.update(status=status, due=f'2030-01-{word_id % 28 + 1:02d}T00:00:00')
+        words.append(word)
+    return words
+
+
+def restart(monkeypatch):
+    # A new process starts without open journals
+    monkeypatch.setattr(journal, '_journals', {})
+
+
+def test_journal_is_replayed_after_a_crash(app_dir, monkeypatch):
+    store = CsvStorage()
+    write_wordlist('crashed', 10)
+    words = graded(store, 'crashed', [1, 4, 7])
+    store.update_words('crashed', words)
+    store.update_words('crashed', graded(store, 'crashed', [4], status='d3'))
+
+    restart(monkeypatch)
+    wordlist = store.load('crashed')
+    assert [(word['status'], word['due']) for word in wordlist if word['status']] == [
+        ('h4', '2030-01-02T00:00:00'), ('d3', '2030-01-05T00:00:00'), ('h4', '2030-01-08T00:00:00')
+    ]
+    deck = store.load_deck('crashed')
+    assert [deck.status_of(word_id) for word_id in (1, 4, 7)] == ['h4', 'd3', 'h4']
+    assert deck.learned_count() == 3
+
+
+def test_torn_final_entry_is_ignored_and_terminated(app_dir, monkeypatch):
+    store = CsvStorage()
+    write_wordlist('torn', 5)
+    store.update_words('torn', graded(store, 'torn', [0]))
+    store.journal('torn').close()
+    with open(store.journal('torn').path, 'a', encoding='utf-8') as f:
+        f.write('{"id": 2, "swahili": "swahili 2", "sta')
+
+    restart(monkeypatch)
+    assert [word['status'] for word in store.load('torn')] == ['h4', '', '', '', '']
+    store.update_words('torn', graded(store, 'torn', [3]))
+    assert [word['status'] for word in store.load('torn')] == ['h4', '', '', 'h4', '']
+
+
+def test_journal_of_a_replaced_snapshot_is_ignored(app_dir, monkeypatch):
+    store = CsvStorage()
+    write_wordlist('replaced', 5)
+    store.update_words('replaced', graded(store, 'replaced', [2]))
+    store.journal('replaced').close()
+
+    # A crash between writing the new CSV and starting a new journal
+    write_wordlist('replaced', 5)
+    restart(monkeypatch)
+    assert all(word['status'] == '' for word in store.load('replaced'))
+
+
+def test_compaction_keeps_every_update(app_dir, monkeypatch):
+    monkeypatch.setattr(storage, 'COMPACT_BYTES', 2048)
+    store = CsvStorage()
+    write_wordlist('compacting', 200)
+    expected = {}
+    for word_id in range(0, 200, 3):
+        store.update_words('compacting', graded(store, 'compacting', [word_id]))
+        expected[word_id] = f'2030-01-{word_id % 28 + 1:02d}T00:00:00'
+    assert store.journal('compacting').size() < 2048  # Compacted along the way
+
+    store.compact('compacting')
+    assert list(store.journal('compacting').entries()) == []
+    with open(store.path('compacting'), 'r', newline='', encoding='utf-8') as f:
+        rows = list(storage.read_csv_rows(f))
+    assert {word_id: row['due'] for word_id, row in enumerate(rows) if row['status']} == expected
+
+    restart(monkeypatch)
+    assert store.load_deck('compacting').learned_count() == len(expected)
+    assert os.path.exists(store.snapshot_path('compacting'))
@@ -0,0 +1,113 @@
+# tests/test_locking.py
+
+import threading
+import time
+
+import pytest
+
+from conftest import write_wordlist
+from locking import GroupCommit, user_lock
+from storage import CsvStorage
+
+THREADS = 16
+
+
+def submit_concurrently(group_commit, username, words_per_thread):
+    start = threading.Barrier(len(words_per_thread))
+    results = [None] * len(words_per_thread)
+
+    def run(n):
+        start.wait()
+        try:
+            results[n] = group_commit.submit(username, words_per_thread[n])
+        except Exception as error:
+            results[n] = error
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(len(words_per_thread))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_group_commit_writes_every_update():
+    batches = []
+
+    def write(username, words):
+        time.sleep(0.01)  # Long enough for other threads to queue behind the leader
+        batches.append(list(words))
+        return len(batches)
+
+    group_commit = GroupCommit(write)
+    results = submit_concurrently(group_commit, 'grouped', [
+        [{'id': n, 'status': 'h4'}] for n in range(THREADS)
+    ])
+
+    written = [word['id'] for batch in batches for word in batch]
+    assert sorted(written) == list(range(THREADS))
+    assert len(batches) < THREADS
+    # Each thread returns once its own batch is written
+    assert sorted(set(results)) == list(range(1, len(batches) + 1))
+
+
+def test_group_commit_keeps_the_latest_update_to_a_word():
+    written = []
+    group_commit = GroupCommit(lambda username, words: written.extend(words))
+    group_commit.submit('latest', [{'id': 1, 'status': 'h4'}, {'id': 1, 'status': 'd3'}])
+    assert written == [{'id': 1, 'status': 'd3'}]
+
+
+def test_group_commit_raises_a_failed_write_in_every_waiter():
+    def write(username, words):
+        time.sleep(0.01)
+        raise OSError('disk full')
+
+    results = submit_concurrently(GroupCommit(write), 'failing', [[{'id': n}] for n in range(THREADS)])
+    assert all(isinstance(result, OSError) for result in results)
+
+
+def test_group_committed_grades_all_reach_the_journal(app_dir, monkeypatch):
+    monkeypatch.setenv('SIMGUISTIC_GROUP_COMMIT', '1')
+    store = CsvStorage()
+    write_wordlist('committed', THREADS)
+    wordlist = store.load('committed')
+    for word in wordlist:
+        word.update(status='h4', due='2030-01-01T00:00:00')
+
+    results = submit_concurrently(store._group_commit, 'committed', [[word] for word in wordlist])
+    assert not any(isinstance(result, Exception) for result in results)
+    assert all(word['status'] == 'h4' for word in CsvStorage().load('committed'))
+
+
+def test_user_lock_is_reentrant_and_exclusive(app_dir):
+    entered = threading.Event()
+
+    def contend():
+        with user_lock('locked'):
+            entered.set()
+
+    with user_lock('locked'):
+        with user_lock('locked', shared=True):
+            thread = threading.Thread(target=contend)
+            thread.start()
+            assert not entered.wait(0.05)
+    thread.join(1)
+    assert entered.is_set()
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_user_lock_is_released_on_error(app_dir, shared):
+    with pytest.raises(ValueError):
+        with user_lock('released', shared=shared):
+            raise ValueError
+    acquired = []
+
+    def acquire():
+        with user_lock('released'):
+            acquired.append(True)
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    thread.join(1)
+    assert acquired == [True]
@@ -0,0 +1,36 @@
+# tests/test_scheduler.py
+
+import time
+from array import array
+
+from deck import NO_DUE, OTHER
+from scheduler import DAY, INTERVAL_SECONDS, MAX_SHIFT_DAYS, cap_daily_load, daily_load, fuzz_dues
+
+NOW = int(time.time())
+
+
+def test_cap_spreads_an_overfull_day_and_is_idempotent():
+    code = next(code for code in range(1, 256) if MAX_SHIFT_DAYS[code] >= 2)
+    status = bytearray([code] * 30 + [0, OTHER])
+    due = array('q', [NOW + 10 * DAY] * 30 + [NOW + 10 * DAY, NO_DUE])
+
+    capped = cap_daily_load(status, due, NOW, 10, 0)
+    load = daily_load(status, capped, NOW, 0)
+    assert max(load.values()) == 10
+    assert sum(load.values()) == 30  # Neither the unlearned nor the undated word counts
+    assert capped[30] == due[30]
+    assert all((capped[word_id] - due[word_id]) % DAY == 0 for word_id in range(30))
+    assert cap_daily_load(status, capped, NOW, 10, 0) == capped
+
+
+def test_fuzz_is_reproducible_and_bounded():
+    status = bytearray([3] * 100 + [0, OTHER])
+    due = array('q', [NOW + n * 3600 for n in range(1, 101)] + [NOW + DAY, NOW + DAY])
+
+    fuzzed = fuzz_dues(status, due, NOW, 0.1)
+    assert fuzzed == fuzz_dues(status, due, NOW, 0.1)
+    assert fuzzed[100:] == due[100:]
+    assert sum(fuzzed[n] != due[n] for n in range(100)) > 50
+    for word_id in range(100):
+        assert abs(fuzzed[word_id] - due[word_id]) <= 0.1 * INTERVAL_SECONDS[3]
+        assert fuzzed[word_id] > NOW
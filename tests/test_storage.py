@@ -0,0 +1,144 @@
+# tests/test_storage.py
+
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import storage
+from conftest import write_wordlist
+from storage import CsvStorage, OverlayStorage, SqliteStorage
+
+WORKERS = 4
+
+
+def test_new_overlay_user_starts_without_progress(app_dir):
+    overlay = OverlayStorage(CsvStorage())
+    overlay.create('fresh', 'basic')
+
+    deck = overlay.load_deck('fresh')
+    assert deck.learned_count() == 0
+    assert deck.count_due(int(time.time())) == 0
+    assert deck.not_learned_count() == len(deck)
+    assert all(word['status'] == '' and word['due'] == '' for word in overlay.load('fresh'))
+
+
+def test_overlay_compaction_keeps_only_own_progress(app_dir):
+    overlay = OverlayStorage(CsvStorage())
+    overlay.create('compacted', 'basic')
+    word = overlay.load('compacted')[2]
+    word.update(status='h4', due='2030-01-01T00:00:00')
+    overlay.update_words('compacted', [word])
+
+    overlay.compact('compacted')
+    assert overlay._read_progress('compacted') == ('basic', [[2, 'h4', '2030-01-01T00:00:00']])
+    assert overlay.load_deck('compacted').learned_count() == 1
+
+
+def test_base_deck_list_is_cached_until_directory_changes(app_dir, monkeypatch):
+    assert storage.list_base_decks() == ['basic']
+    listings = []
+    listdir = os.listdir
+    monkeypatch.setattr(os, 'listdir', lambda path: listings.append(path) or listdir(path))
+    assert storage.list_base_decks() == ['basic']
+    assert listings == []
+
+    (app_dir / 'decks' / 'extra.csv').write_text('english,swahili,status,due\n', encoding='utf-8')
+    os.utime(app_dir / 'decks', ns=(0, 1))
+    assert storage.list_base_decks() == ['basic', 'extra']
+    assert len(listings) == 1
+
+
+def _open_and_grade(username, index, barrier, results):
+    # One worker process: opens the database with the others, then grades its share of words
+    barrier.wait()
+    sqlite_storage = SqliteStorage()
+    wordlist = sqlite_storage.load(username)
+    words = [dict(word, status='h4', due='2030-01-01T00:00:00') for word in wordlist[index:40:WORKERS]]
+    sqlite_storage.update_words(username, words)
+    results.put(len(wordlist))
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_sqlite_database_is_seeded_once_across_processes(app_dir):
+    write_wordlist('seeded', 20000)
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(WORKERS)
+    results = context.Queue()
+    processes = [
+        context.Process(target=_open_and_grade, args=('seeded', index, barrier, results))
+        for index in range(WORKERS)
+    ]
+    for process in processes:
+        process.start()
+    counts = [results.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    assert counts == [20000] * WORKERS
+    wordlist = SqliteStorage().load('seeded')
+    assert len(wordlist) == 20000
+    assert [word['status'] for word in wordlist[:41]] == ['h4'] * 40 + ['']
+
+
+def test_missing_decks_directory_has_no_decks(app_dir, monkeypatch):
+    monkeypatch.setattr(storage, 'DECKS_DIR', str(app_dir / 'missing'))
+    assert storage.list_base_decks() == []
+    with pytest.raises(ValueError):
+        storage.get_base_deck('basic')
+
+
+def _rewrite_csv(path, status, how):
+    # Changes every status in the CSV, leaving the file id intact except for 'how'
+    st = os.stat(path)
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        rows = list(storage.read_csv_rows(f))
+    for row in rows:
+        row['status'] = status
+    if how == 'size':
+        rows.append({'english': 'extra', 'swahili': 'ziada', 'status': status, 'due': ''})
+    target = path + '.new' if how == 'inode' else path
+    with open(target, 'w', newline='', encoding='utf-8') as f:
+        storage.write_csv_rows(f, rows)
+    mtime_ns = st.st_mtime_ns + 1_000_000_000 if how == 'mtime' else st.st_mtime_ns
+    os.utime(target, ns=(st.st_atime_ns, mtime_ns))
+    if how == 'inode':
+        os.replace(target, path)
+
+
+@pytest.mark.parametrize('how', ['mtime', 'size', 'inode'])
+def test_snapshot_is_rebuilt_when_the_csv_changes(app_dir, how):
+    write_wordlist('snapped', 50, status='h4', due='2030-01-01T00:00:00')
+    csv_path = os.path.join('users', 'snapped_wordlist.csv')
+    snap_path = os.path.join('users', 'cache', 'snapped.snap')
+
+    deck, size = storage.load_csv_deck(csv_path, snap_path)
+    assert size == os.path.getsize(csv_path)
+    deck, size = storage.load_csv_deck(csv_path, snap_path)
+    assert size == os.path.getsize(snap_path)  # Served from the snapshot
+    assert deck.status_of(0) == 'h4'
+
+    _rewrite_csv(csv_path, 'd3', how)
+    deck, size = storage.load_csv_deck(csv_path, snap_path)
+    assert size == os.path.getsize(csv_path)
+    assert {deck.status_of(word_id) for word_id in range(len(deck))} == {'d3'}
+
+    deck, size = storage.load_csv_deck(csv_path, snap_path)
+    assert size == os.path.getsize(snap_path)
+    assert deck.status_of(0) == 'd3'
+
+
+def test_damaged_snapshot_is_rebuilt(app_dir):
+    write_wordlist('damaged', 50, status='h4', due='2030-01-01T00:00:00')
+    store = CsvStorage()
+    expected = store.load_deck('damaged').to_wordlist()
+    snap_path = store.snapshot_path('damaged')
+    with open(snap_path, 'r+b') as f:
+        f.truncate(os.path.getsize(snap_path) // 2)
+
+    assert store.load_deck('damaged').to_wordlist() == expected
+    deck, size = storage.load_csv_deck(store.path('damaged'), snap_path)
+    assert size == os.path.getsize(snap_path)
+    assert deck.to_wordlist() == expected
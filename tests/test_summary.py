@@ -0,0 +1,33 @@
+# tests/test_summary.py
+
+from datetime import datetime
+
+from deck import Deck
+from summary import BUCKET_SECONDS, Summary
+
+HOUR_START = 1_900_000_000 // BUCKET_SECONDS * BUCKET_SECONDS
+
+
+def make_deck(due_times):
+    return Deck.from_wordlist([
+        {'english': f'e{n}', 'swahili': f's{n}', 'status': 'h4', 'due': datetime.fromtimestamp(due_ts).isoformat()}
+        for n, due_ts in enumerate(due_times)
+    ])
+
+
+def test_due_count_matches_the_deck_within_the_hour():
+    deck = make_deck([HOUR_START - 7200, HOUR_START + 60, HOUR_START + 600, HOUR_START + 4000])
+    summary = Summary.from_deck('sig', deck)
+    for now_ts in (HOUR_START - 1, HOUR_START + 59, HOUR_START + 120, HOUR_START + 600, HOUR_START + 3599,
+                   HOUR_START + 4000, HOUR_START + 90000):
+        assert summary.count_due(now_ts, lambda: deck) == deck.count_due(now_ts)
+
+
+def test_due_count_skips_the_deck_when_nothing_is_due_this_hour():
+    deck = make_deck([HOUR_START - 7200, HOUR_START + 7200])
+
+    def load_deck():
+        raise AssertionError('deck loaded')
+
+    summary = Summary.from_deck('sig', deck)
+    assert summary.count_due(HOUR_START + 60, load_deck) == 1
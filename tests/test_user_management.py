@@ -0,0 +1,40 @@
+# tests/test_user_management.py
+
+import os
+
+import wordlist_utils
+from conftest import write_wordlist
+from user_management import UserRegistry
+
+
+def test_grading_does_not_relist_the_users_directory(app_dir, monkeypatch):
+    write_wordlist('lister', 50)
+    registry = UserRegistry()
+    assert registry.users() == ['lister']
+    word = wordlist_utils.load_wordlist('lister')[0]  # Writes the deck snapshot
+    word.update(status='h4', due='2030-01-01T00:00:00')
+    wordlist_utils.update_word('lister', word)  # Creates the journal
+    wordlist_utils.get_word_counts('lister')
+    registry.users()
+    mtime = os.stat('users').st_mtime_ns
+
+    for word in wordlist_utils.load_wordlist('lister')[1:20]:
+        word.update(status='h4', due='2030-01-01T00:00:00')
+        wordlist_utils.update_word('lister', word)
+        wordlist_utils.get_word_counts('lister')  # Writes the summary
+    assert os.stat('users').st_mtime_ns == mtime
+
+    listings = []
+    listdir = os.listdir
+    monkeypatch.setattr(os, 'listdir', lambda path: listings.append(path) or listdir(path))
+    assert registry.users() == ['lister']
+    assert listings == []
+
+
+def test_new_users_are_seen(app_dir):
+    registry = UserRegistry()
+    assert registry.users() == []
+    write_wordlist('newcomer', 5)
+    os.utime('users', ns=(0, 1))
+    assert registry.users() == ['newcomer']
+    assert registry.metadata('newcomer')['last_activity'] is not None
@@ -0,0 +1,104 @@
+# tests/test_write_behind.py
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from write_behind import WriteBehind
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EXIT_SCRIPT = """
+import json, sys
+from write_behind import WriteBehind
+
+def write(username, words):
+    with open(sys.argv[1], 'a') as f:
+        f.write(json.dumps([username, words]) + '\\n')
+
+queue = WriteBehind(write, interval=3600)
+for n in range(5):
+    queue.submit('leaving', [{'id': n, 'status': 'h4'}])
+queue.submit('leaving', [{'id': 0, 'status': 'd3'}])
+"""
+
+
+class Recorder:
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+        self.written = threading.Event()
+
+    def __call__(self, username, words):
+        if self.failures:
+            self.failures -= 1
+            raise OSError('disk full')
+        self.batches.append((username, words))
+        self.written.set()
+
+
+def test_flush_writes_every_queued_word_once_per_user():
+    recorder = Recorder()
+    queue = WriteBehind(recorder, interval=3600)
+    for n in range(10):
+        queue.submit('first', [{'id': n % 4, 'status': f's{n}'}])
+    queue.submit('second', [{'id': 7, 'status': 'h4'}])
+    assert [word['status'] for word in queue.pending_words('first')] == ['s8', 's9', 's6', 's7']
+
+    queue.flush()
+    assert sorted(recorder.batches) == [
+        ('first', [{'id': 0, 'status': 's8'}, {'id': 1, 'status': 's9'},
+                   {'id': 2, 'status': 's6'}, {'id': 3, 'status': 's7'}]),
+        ('second', [{'id': 7, 'status': 'h4'}]),
+    ]
+    assert queue.pending_words('first') == []
+    queue.flush()
+    assert len(recorder.batches) == 2
+
+
+def test_background_thread_flushes_a_full_batch():
+    recorder = Recorder()
+    queue = WriteBehind(recorder, interval=3600, batch_size=3)
+    queue.submit('batched', [{'id': n} for n in range(3)])
+    assert recorder.written.wait(5)
+    assert recorder.batches == [('batched', [{'id': 0}, {'id': 1}, {'id': 2}])]
+
+
+def test_failed_write_is_retried_without_overwriting_newer_updates():
+    recorder = Recorder(failures=1)
+    queue = WriteBehind(recorder, interval=3600)
+    queue.submit('retried', [{'id': 1, 'status': 'h4'}, {'id': 2, 'status': 'h4'}])
+    queue.flush()
+    assert recorder.batches == []
+    assert len(queue.pending_words('retried')) == 2
+
+    queue.submit('retried', [{'id': 2, 'status': 'd3'}])
+    queue.flush()
+    assert recorder.batches == [('retried', [{'id': 1, 'status': 'h4'}, {'id': 2, 'status': 'd3'}])]
+
+
+def test_queued_words_are_written_at_exit(tmp_path):
+    output = tmp_path / 'written.jsonl'
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    subprocess.run([sys.executable, '-c', EXIT_SCRIPT, str(output)], env=env, check=True, timeout=30)
+
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    assert lines == [['leaving', [{'id': n, 'status': 'd3' if n == 0 else 'h4'} for n in range(5)]]]
+
+
+def test_words_being_written_stay_visible():
+    release = threading.Event()
+    queue = WriteBehind(lambda username, words: release.wait(5), interval=3600)
+    queue.submit('visible', [{'id': 3}])
+    flusher = threading.Thread(target=queue.flush)
+    flusher.start()
+    deadline = time.monotonic() + 5
+    while queue.pending_words('visible') and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert queue.pending_words('visible', include_in_flight=True) == [{'id': 3}]
+    release.set()
+    flusher.join()
+    assert queue.pending_words('visible', include_in_flight=True) == []
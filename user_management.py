@@ -2,21 +2,142 @@
 
 from flask import session
 import os
+import re
+import threading
+import time
+
+from storage import get_storage, list_base_decks
+
+USERS_DIR = 'users'
+USERNAME_PATTERN = re.compile(r'[a-z0-9_-]{1,32}')
+WORDLIST_SUFFIXES = {'_wordlist.csv': 'csv', '_wordlist.db': 'sqlite', '_progress.json': 'overlay'}
+BACKEND_RANK = {'csv': 0, 'sqlite': 1, 'overlay': 2}  # Backend that wins when a user has several files
+ACTIVITY_SUFFIXES = (
+    '_wordlist.csv', '_wordlist.journal', '_wordlist.db', '_wordlist.db-wal',
+    '_progress.json', '_progress.journal'
+)
+
+class UserRegistry:
+    """
+    The users with a wordlist in the 'users' directory, named
+    '{username}_wordlist.csv', '{username}_wordlist.db' or
+    '{username}_progress.json', with metadata about each.
+
+    The directory is only listed again when its mtime changes, which it
+    does whenever a file is added, removed or renamed in it; derived files
+    are kept in 'users/cache' so that grading rarely does. Metadata holds
+    the storage backend, the deck size once a deck has been loaded, and the
+    time of the last write, read from the files when a user is first seen
+    and then kept current by record_write.
+    """
+
+    def __init__(self, users_dir=USERS_DIR):
+        self.users_dir = users_dir
+        self._users = {}  # username -> metadata dict, in directory order
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.users_dir).st_mtime_ns
+        except FileNotFoundError:
+            os.makedirs(self.users_dir, exist_ok=True)
+            mtime = os.stat(self.users_dir).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        filenames = os.listdir(self.users_dir)
+        users = {}
+        for filename in filenames:
+            for suffix, backend in WORDLIST_SUFFIXES.items():
+                if filename.endswith(suffix):
+                    username = filename[:-len(suffix)]  # Removes the suffix from the filename
+                    previous = self._users.get(username, {})
+                    metadata = users.setdefault(username, {
+                        'backend': backend,
+                        'deck_size': previous.get('deck_size'),
+                        'last_activity': previous.get('last_activity')
+                    })
+                    if BACKEND_RANK[backend] > BACKEND_RANK[metadata['backend']]:
+                        metadata['backend'] = backend
+        for username, metadata in users.items():
+            if username not in self._users:
+                metadata['last_activity'] = self._last_activity(username)
+        self._users = users
+        self._mtime = mtime
+
+    def _last_activity(self, username):
+        mtimes = []
+        for suffix in ACTIVITY_SUFFIXES:
+            try:
+                mtimes.append(os.stat(os.path.join(self.users_dir, username + suffix)).st_mtime)
+            except FileNotFoundError:
+                pass
+        return max(mtimes) if mtimes else None
+
+    def users(self):
+        with self._lock:
+            self._refresh()
+            return list(self._users)
+
+    def exists(self, username):
+        with self._lock:
+            self._refresh()
+            return username in self._users
+
+    def metadata(self, username):
+        """
+        Returns a copy of the user's metadata, or None for an unknown user.
+        """
+        with self._lock:
+            self._refresh()
+            metadata = self._users.get(username)
+            return dict(metadata) if metadata is not None else None
+
+    def record_write(self, username):
+        with self._lock:
+            metadata = self._users.get(username)
+            if metadata is not None:
+                metadata['last_activity'] = time.time()
+
+    def record_deck_size(self, username, deck_size):
+        with self._lock:
+            metadata = self._users.get(username)
+            if metadata is not None:
+                metadata['deck_size'] = deck_size
+
+_registry = UserRegistry()
+
+def get_user_registry():
+    return _registry
 
 def get_users():
     """
-    Retrieves the list of users by scanning the 'users' directory
-    for CSV files named '{username}_wordlist.csv'.
-    """
-    users = []
-    users_dir = 'users'
-    if not os.path.exists(users_dir):
-        os.makedirs(users_dir)
-    for filename in os.listdir(users_dir):
-        if filename.endswith('_wordlist.csv'):
-            username = filename[:-13]  # Removes '_wordlist.csv' from the filename
-            users.append(username)
-    return users
+    Retrieves the list of users from the user registry.
+    """
+    return _registry.users()
+
+def user_exists(username):
+    """
+    Returns True if the user has a wordlist.
+    """
+    return _registry.exists(username)
+
+def get_decks():
+    """
+    Names of the base decks new users can be created from.
+    """
+    return list_base_decks()
+
+def create_user(username, deck_name):
+    """
+    Creates a user on a shared base deck; only their progress is stored.
+    Raises ValueError for an invalid or taken username or an unknown deck.
+    """
+    if not USERNAME_PATTERN.fullmatch(username):
+        raise ValueError('Usernames are 1 to 32 lowercase letters, digits, dashes or underscores.')
+    if deck_name not in get_decks():
+        raise ValueError(f'Unknown deck: {deck_name}')
+    get_storage().create(username, deck_name)
 
 def set_current_user(username):
     """
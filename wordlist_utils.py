@@ -1,40 +1,367 @@
 # wordlist_utils.py
 
 import csv
+import hashlib
+import io
+import itertools
+import json
+import logging
 import os
-from datetime import datetime
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
 
-def load_wordlist(username):
+from deck import Deck, epoch_to_due
+from grading import find_other_card
+from metrics import timer
+from storage import FIELDNAMES, get_storage
+from summary import Summary, SummaryStore, status_change
+from user_management import get_user_registry
+from write_behind import WriteBehind
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAX_ENTRIES = 64  # Users whose decks are kept in memory
+CACHE_MAX_BYTES = 64 * 1024 * 1024  # Approximate memory budget for cached decks
+EXPORT_CHUNK_ROWS = 1000  # Rows per chunk of a streamed CSV export
+WRITE_BEHIND = bool(os.environ.get('SIMGUISTIC_WRITE_BEHIND'))  # Queue grading writes for a background thread
+
+class WordlistCache:
+    """
+    Process-wide LRU cache of parsed wordlists, held as Decks and keyed by username.
+
+    Each entry remembers the storage signature (file sizes and mtimes) it
+    was read at, so writes from other processes invalidate it. Writes made
+    through this module update the entry in place instead.
     """
-    Loads the user's wordlist from a CSV file.
-    """
-    filepath = os.path.join('users', f'{username}_wordlist.csv')
-    wordlist = []
-    if not os.path.exists(filepath):
-        return wordlist  # Return empty list if file doesn't exist
-    with open(filepath, 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            word = {
-                'english': row['english'],
-                'swahili': row['swahili'],
-                'status': row.get('status', ''),
-                'due': row.get('due', '')
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # username -> [signature, deck, size]
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, username, signature):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] != signature:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, username, signature, deck):
+        size = deck.nbytes()
+        with self._lock:
+            self._discard(username)
+            if size > self.max_bytes:
+                return
+            self._entries[username] = [signature, deck, size]
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+                self.evictions += 1
+
+    def update(self, username, before, after, words):
+        """
+        Applies status/due changes to a cached deck after they were written.
+
+        'before' and 'after' are the storage signatures around the write. If
+        the entry was read at neither, someone else wrote in between and the
+        entry is dropped rather than patched. (It can already be at 'after'
+        when a group commit wrote this update together with another.)
+        """
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return
+            if entry[0] != before and entry[0] != after:
+                self._discard(username)
+                return
+            deck = entry[1]
+            for word in words:
+                if 0 <= word['id'] < len(deck):
+                    deck.update(word['id'], word['status'], word['due'])
+            entry[0] = after
+
+    def patch(self, username, words):
+        """
+        Applies status/due changes that have not been written yet to a cached
+        deck, leaving its signature as it is.
+        """
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return
+            deck = entry[1]
+            for word in words:
+                if 0 <= word['id'] < len(deck):
+                    deck.update(word['id'], word['status'], word['due'])
+
+    def invalidate(self, username):
+        with self._lock:
+            self._discard(username)
+
+    def _discard(self, username):
+        entry = self._entries.pop(username, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
             }
-            wordlist.append(word)
-    return wordlist
+
+_cache = WordlistCache()
+_summaries = SummaryStore()
+_write_counter = itertools.count(1)
+_versions = {}  # username -> number of the last write made through this process
+
+def _bump_version(username):
+    _versions[username] = next(_write_counter)
+
+def get_deck_version(username):
+    """
+    A JSON-serializable value that changes whenever the user's deck or
+    summary does, whether written by this process or another.
+    """
+    return [get_storage().signature(username), _versions.get(username, 0)]
+
+def _flush_words(username, words):
+    # Runs on the write-behind thread, outside any request
+    before, after = get_storage().update_words(username, words)
+    with _write_behind.lock:
+        _cache.update(username, before, after, words)
+        # Updates queued while this batch was written must win over it
+        pending = _write_behind.pending_words(username)
+        _cache.patch(username, pending)
+        # The summary already counts the queued updates, so it is only saved
+        # without them; a saved summary that is off would never be rebuilt
+        _summaries.update(username, before, after, [], persist=not pending)
+    get_user_registry().record_write(username)
+
+_write_behind = WriteBehind(_flush_words) if WRITE_BEHIND else None
+
+def _apply_words(deck, words):
+    for word in words:
+        if 0 <= word['id'] < len(deck):
+            deck.update(word['id'], word['status'], word['due'])
+
+def _queued_words(username):
+    if _write_behind is None:
+        return []
+    return _write_behind.pending_words(username, include_in_flight=True)
+
+def get_cache_stats():
+    """
+    Returns hit/miss counters and the current size of the wordlist cache.
+    """
+    return _cache.stats()
+
+def preload_decks(usernames):
+    """
+    Loads the users' decks into the cache, rewriting any stale snapshots on
+    the way, so a freshly started worker does not parse them on first use.
+    """
+    for username in usernames:
+        try:
+            _load(username)
+        except Exception:
+            logger.exception('Could not preload the deck of %s', username)
+
+def load_deck(username):
+    """
+    Returns the user's Deck, from the cache when storage has not changed.
+    The deck is shared with the cache and must not be modified directly;
+    use save_wordlist or update_words to change it.
+    """
+    return _load(username)[1]
+
+def _load(username):
+    # Returns the deck along with the storage signature it was read at
+    storage = get_storage()
+    with timer('load_wordlist'):
+        signature = storage.signature(username)
+        deck = _cache.get(username, signature)
+        if deck is None:
+            if _write_behind is None:
+                deck = storage.load_deck(username)
+                _cache.put(username, signature, deck)
+            else:
+                # Words being written now may land in storage during the load,
+                # so they are taken before it, and words queued since after it
+                written = _queued_words(username)
+                deck = storage.load_deck(username)
+                with _write_behind.lock:
+                    _apply_words(deck, written + _queued_words(username))
+                    _cache.put(username, signature, deck)
+            get_user_registry().record_deck_size(username, len(deck))
+    return signature, deck
+
+def load_wordlist(username):
+    """
+    Loads the user's wordlist as a list of word dicts.
+    """
+    return load_deck(username).to_wordlist()
+
+def get_due_word_ids(username, limit=None):
+    """
+    Returns the ids of the words due for review now, most overdue first.
+    """
+    return load_deck(username).due_ids(time.time(), limit)
+
+def get_due_chunk(username, limit, after=None):
+    """
+    Returns up to 'limit' ids of due words that come after the key 'after'
+    in due order, most overdue first, and the key to pass for the next chunk.
+    """
+    deck = load_deck(username)
+    word_ids = deck.due_ids(time.time(), limit, after)
+    if not word_ids:
+        return [], after
+    return word_ids, deck.due_key(word_ids[-1])
+
+def get_unlearned_word_ids(username, limit=None):
+    """
+    Returns the ids of words that have not been learned yet, in deck order.
+    """
+    return load_deck(username).unlearned_ids(limit)
+
+def get_word(username, word_id):
+    """
+    Returns a single word by its 'id', or None if there is no such word.
+    """
+    deck = load_deck(username)
+    if 0 <= word_id < len(deck):
+        return deck.word(word_id)
+    return None
+
+def get_other_card_hint(username, user_input, word_id):
+    """
+    Explains a wrong answer that is the translation of another word in the
+    deck, or returns None.
+    """
+    deck = load_deck(username)
+    other_id = find_other_card(deck, user_input, word_id)
+    if other_id is None:
+        return None
+    return f"'{deck.swahili[other_id]}' is the Swahili for '{deck.english[other_id]}'."
 
 def save_wordlist(username, wordlist):
     """
-    Saves the user's wordlist to a CSV file.
+    Saves the user's whole wordlist to the configured storage backend.
+    """
+    if _write_behind is not None:
+        _write_behind.flush(username)  # Queued updates are older than this save
+    with timer('save_wordlist'):
+        signature = get_storage().save(username, wordlist)
+        deck = Deck.from_wordlist(wordlist)
+        _cache.put(username, signature, deck)
+        _summaries.put(username, Summary.from_deck(signature, deck))
+    _bump_version(username)
+    registry = get_user_registry()
+    registry.record_write(username)
+    registry.record_deck_size(username, len(deck))
+
+def update_word(username, word):
+    """
+    Persists the status and due date of a single word, identified by its 'id'.
+    """
+    update_words(username, [word])
+
+def update_words(username, words):
+    """
+    Persists the status and due dates of several words in one write, and
+    moves the words between the counts of the user's summary.
+
+    In write-behind mode the words are only applied to the cached deck and
+    summary and queued; the background thread writes them shortly after.
+    """
+    if words and _write_behind is not None:
+        signature, deck = _load(username)
+        with _write_behind.lock:
+            changes = [status_change(deck, word) for word in words if 0 <= word['id'] < len(deck)]
+            _apply_words(deck, words)
+            _cache.patch(username, words)  # In case the cached deck was replaced meanwhile
+            if not _summaries.update(username, signature, signature, changes, persist=False):
+                _summaries.put(username, Summary.from_deck(signature, deck), persist=False)
+            _write_behind.submit(username, words)
+            _bump_version(username)
+    elif words:
+        signature, deck = _load(username)
+        changes = [status_change(deck, word) for word in words if 0 <= word['id'] < len(deck)]
+        with timer('save_wordlist'):
+            before, after = get_storage().update_words(username, words)
+            _cache.update(username, before, after, words)
+        get_user_registry().record_write(username)
+        # The old statuses are only right if nobody wrote since the deck was read;
+        # otherwise the summary goes stale and is rebuilt on its next read
+        if signature == before:
+            _summaries.update(username, before, after, changes)
+        _bump_version(username)
+
+def append_words(username, words):
+    """
+    Adds new words to the end of the user's wordlist, creating it if needed.
+    """
+    if words:
+        with timer('save_wordlist'):
+            get_storage().append_words(username, words)
+            _cache.invalidate(username)
+        _bump_version(username)
+        get_user_registry().record_write(username)
+
+def wordlist_exists(username):
+    """
+    Returns True if the user has a stored wordlist.
+    """
+    return get_storage().exists(username)
+
+def iter_wordlist_csv(username, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Yields the user's wordlist as CSV text in chunks of 'chunk_rows' rows,
+    whatever the backend. The rows come from a copy of the deck's status
+    and due columns taken up front, so writes during a slow download do
+    not mix two versions of the deck.
     """
-    filepath = os.path.join('users', f'{username}_wordlist.csv')
-    with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['english', 'swahili', 'status', 'due']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for word in wordlist:
-            writer.writerow(word)
+    deck = load_deck(username).fork()
+    text = io.StringIO(newline='')
+    writer = csv.writer(text)
+    writer.writerow(FIELDNAMES)
+    for word_id in range(len(deck)):
+        writer.writerow([deck.english[word_id], deck.swahili[word_id],
+                         deck.status_of(word_id), epoch_to_due(deck.due[word_id])])
+        if (word_id + 1) % chunk_rows == 0:
+            yield text.getvalue()
+            text.seek(0)
+            text.truncate()
+    yield text.getvalue()
+
+def get_wordlist_version(username):
+    """
+    Returns an ETag value and the last modification time (UTC) of the
+    user's wordlist, both derived from the storage signature.
+    """
+    if _write_behind is not None:
+        _write_behind.flush(username)  # So the signature covers every update
+    signature = get_storage().signature(username)
+    etag = hashlib.sha1(json.dumps(signature).encode('utf-8')).hexdigest()[:20]
+    # Each part of a signature is [inode, size, mtime_ns], or None for a missing file
+    mtimes = [part[2] for part in signature if part]
+    last_modified = datetime.fromtimestamp(max(mtimes) // 10**9, timezone.utc) if mtimes else None
+    return etag, last_modified
 
 def calculate_due_date(status):
     """
@@ -56,17 +383,16 @@ def calculate_due_date(status):
 
 def get_word_counts(username):
     """
-    Returns the number of words learned and due for review.
+    Returns the number of words learned, due for review and not yet learned,
+    from the user's summary. The deck is only loaded to rebuild a missing or
+    out-of-date summary, or to count exactly the words due this hour.
     """
-    wordlist = load_wordlist(username)
-    total_learned = sum(1 for word in wordlist if word['status'])
-    now = datetime.now()
-    due_for_review = sum(1 for word in wordlist if word['status'] and word['due'] and datetime.fromisoformat(word['due']) <= now)
-    not_learned = sum(
-        1 for word in wordlist
-        if not word.get('status') and not word.get('due'))
-    return total_learned, due_for_review, not_learned
-
-def get_wordlist_filepath(username):
-    # Adjust the path according to where your wordlists are stored
-    return os.path.join('users/', f'{username}_wordlist.csv')
\ No newline at end of file
+    with timer('get_word_counts'):
+        summary = _summaries.get(username, get_storage().signature(username))
+        if summary is None:
+            signature, deck = _load(username)
+            summary = Summary.from_deck(signature, deck)
+            # Not saved while it counts updates that are still queued
+            _summaries.put(username, summary, persist=not _queued_words(username))
+        due = summary.count_due(int(time.time()), lambda: _load(username)[1])
+        return summary.learned, due, summary.not_learned
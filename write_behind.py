@@ -0,0 +1,105 @@
+# write_behind.py
+
+import atexit
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = float(os.environ.get('SIMGUISTIC_WRITE_BEHIND_INTERVAL', 0.2))  # Seconds between flushes
+FLUSH_BATCH = int(os.environ.get('SIMGUISTIC_WRITE_BEHIND_BATCH', 64))  # Pending words that trigger a flush
+
+
+class WriteBehind:
+    """
+    Queues word updates in memory and writes them from a background thread.
+
+    Updates are coalesced per user, later ones to the same word replacing
+    earlier ones, and each user's batch is written in a single call to
+    'write' every FLUSH_INTERVAL seconds, or sooner once FLUSH_BATCH words
+    are waiting. Words stay visible through pending_words until their
+    write has finished. Everything still queued is written at interpreter
+    exit, and a failed write is queued again unless newer updates to the
+    same words have arrived.
+
+    'lock' is held while the queue changes, and may be taken by callers
+    that keep other state, such as a cache, in step with it.
+    """
+
+    def __init__(self, write, interval=FLUSH_INTERVAL, batch_size=FLUSH_BATCH):
+        self._write = write
+        self.interval = interval
+        self.batch_size = batch_size
+        self.lock = threading.RLock()
+        self._pending = {}  # username -> {word id: word}
+        self._in_flight = {}  # username -> {word id: word} being written
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.flush)
+
+    def submit(self, username, words):
+        with self.lock:
+            pending = self._pending.setdefault(username, {})
+            for word in words:
+                pending[word['id']] = dict(word)
+            if len(pending) >= self.batch_size:
+                self._wakeup.set()
+            self._ensure_thread()
+
+    def pending_words(self, username, include_in_flight=False):
+        """
+        Words queued for the user and not yet written, oldest writes first.
+        """
+        with self.lock:
+            words = []
+            if include_in_flight:
+                words.extend(self._in_flight.get(username, {}).values())
+            words.extend(self._pending.get(username, {}).values())
+            return words
+
+    def flush(self, username=None):
+        """
+        Writes everything queued, or only what is queued for one user.
+        """
+        with self._flush_lock:
+            with self.lock:
+                usernames = [username] if username is not None else list(self._pending)
+            for name in usernames:
+                self._flush_user(name)
+
+    def _flush_user(self, username):
+        with self.lock:
+            batch = self._pending.pop(username, None)
+            if not batch:
+                return
+            self._in_flight[username] = batch
+        try:
+            self._write(username, list(batch.values()))
+        except Exception:
+            logger.exception('Write-behind flush failed for %s; will retry', username)
+            with self.lock:
+                pending = self._pending.setdefault(username, {})
+                for word_id, word in batch.items():
+                    pending.setdefault(word_id, word)
+        finally:
+            with self.lock:
+                del self._in_flight[username]
+
+    def _ensure_thread(self):
+        # Started on first use, so each forked worker runs its own
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Write-behind flush failed')